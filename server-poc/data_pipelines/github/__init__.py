@@ -1,13 +1,49 @@
 """Source that load github issues, pull requests and reactions for a specific repository via customizable graphql query. Loads events incrementally."""
 
 import urllib.parse
-from typing import Iterator, Optional, Sequence
+from typing import Callable, Iterator, Optional, Sequence
 
 import dlt
-from dlt.common.typing import TDataItems
+from dlt.common.typing import DictStrAny, TDataItems
 from dlt.sources import DltResource
 
-from .helpers import get_reactions_data, get_rest_pages, get_stargazers, get_commits
+from .helpers import get_comment_reactions, get_reactions_data, get_rest_pages, get_stargazers, get_commits, get_commits_partitioned
+from .settings import COMMITS_MAX_PARTITION_SIZE, COMMITS_PARTITION_WORKERS, START_DATE
+
+
+def _since(cursor: dlt.sources.incremental) -> Optional[str]:
+    """The high-water mark to fetch from, None when nothing was loaded yet"""
+    value = cursor.start_value
+    if value is None or value == START_DATE:
+        return None
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def _checkpointed_resource(
+    resource_name: str,
+    get_pages: Callable[[DictStrAny], Iterator[TDataItems]],
+    batch_pages: int,
+) -> DltResource:
+    """Resource that yields at most `batch_pages` pages per pipeline run and keeps its pagination
+    checkpoint in the resource state. dlt commits the state together with the loaded pages, so a
+    failed run resumes after the last loaded batch. The checkpoint is removed once all pages were fetched.
+    """
+    @dlt.resource(name=resource_name, write_disposition="append")
+    def pages() -> Iterator[TDataItems]:
+        state = dlt.current.resource_state()
+        checkpoint = state.setdefault("checkpoint", {})
+        completed_pages = 0
+        for items in get_pages(checkpoint):
+            yield items
+            # pages can be yielded in several chunks, the checkpoint points to the start of the next page
+            # once the last chunk of a page was yielded
+            if checkpoint.get("page_offset") == 0:
+                completed_pages += 1
+                if completed_pages >= batch_pages:
+                    return
+        state.pop("checkpoint", None)
+
+    return pages
 
 
 @dlt.source
@@ -17,6 +53,9 @@ def github_reactions(
     access_token: str = dlt.secrets.value,
     items_per_page: int = 100,
     max_items: Optional[int] = None,
+    incremental: bool = False,
+    updated_since: Optional[str] = None,
+    batch_pages: Optional[int] = None,
 ) -> Sequence[DltResource]:
     """Get reactions associated with issues, pull requests and comments in the repo `name` with owner `owner`.
 
@@ -33,10 +72,31 @@ def github_reactions(
         items_per_page (int, optional): How many issues/pull requests to get in single page. Defaults to 100.
         max_items (int, optional): How many issues/pull requests to get in total. None means All.
         max_item_age_seconds (float, optional): Do not get items older than this. Defaults to None. NOT IMPLEMENTED
+        incremental (bool, optional): Merge items updated since the last load instead of replacing everything. Defaults to False.
+        updated_since (str, optional): Initial high-water mark for incremental loads, e.g. the latest `updated_at` in the destination.
+        batch_pages (int, optional): For full loads, fetch at most this many pages per pipeline run and checkpoint the pagination in the resource state. Run the pipeline until `checkpoint` is gone from the state.
 
     Returns:
         Sequence[DltResource]: Two DltResources: `issues` with issues and `pull_requests` with pull requests
     """
+    if incremental:
+        return tuple(
+            _incremental_reactions_resource(resource_name, node_type, owner, name, access_token, items_per_page, max_items, updated_since)
+            for resource_name, node_type in (("issues", "issues"), ("pull_requests", "pullRequests"))
+        )
+
+    if batch_pages:
+        return tuple(
+            _checkpointed_resource(
+                resource_name,
+                lambda checkpoint, node_type=node_type: get_reactions_data(
+                    node_type, owner, name, access_token, items_per_page, max_items, checkpoint=checkpoint
+                ),
+                batch_pages,
+            )
+            for resource_name, node_type in (("issues", "issues"), ("pull_requests", "pullRequests"))
+        )
+
     return (
         dlt.resource(
             get_reactions_data(
@@ -65,6 +125,61 @@ def github_reactions(
     )
 
 
+def _incremental_reactions_resource(
+    resource_name: str,
+    node_type: str,
+    owner: str,
+    name: str,
+    access_token: str,
+    items_per_page: int,
+    max_items: Optional[int],
+    updated_since: Optional[str],
+) -> DltResource:
+    @dlt.resource(name=resource_name, write_disposition="merge", primary_key="number")
+    def items(
+        updated_at: dlt.sources.incremental[str] = dlt.sources.incremental(
+            "updatedAt", initial_value=updated_since or START_DATE
+        ),
+    ) -> Iterator[TDataItems]:
+        yield from get_reactions_data(
+            node_type,
+            owner,
+            name,
+            access_token,
+            items_per_page,
+            max_items,
+            since=_since(updated_at),
+        )
+
+    return items
+
+
+@dlt.source
+def github_comment_reactions(
+    comment_ids: Sequence[str],
+    access_token: str = dlt.secrets.value,
+) -> Sequence[DltResource]:
+    """Get reactions to the issue or pull request comments with the given node ids.
+
+    Meant as an enrichment stage after `github_reactions`, which flags comments with reactions in `has_reactions`.
+
+    Args:
+        comment_ids (Sequence[str]): Node ids of the comments
+        access_token (str): The classic access token. Will be injected from secrets if not provided.
+
+    Returns:
+        Sequence[DltResource]: One DltResource: `comment_reactions`, keyed by comment, user and reaction
+    """
+    return (
+        dlt.resource(
+            get_comment_reactions(list(comment_ids), access_token),
+            name="comment_reactions",
+            write_disposition="merge",
+            primary_key=("comment_id", "user__login", "content"),
+        ),
+    )
+
+
 @dlt.source(max_table_nesting=2)
 def github_repo_events(
     owner: str, name: str, access_token: Optional[str] = None
@@ -117,6 +232,9 @@ def github_stargazers(
     access_token: str = dlt.secrets.value,
     items_per_page: int = 100,
     max_items: Optional[int] = None,
+    incremental: bool = False,
+    starred_since: Optional[str] = None,
+    batch_pages: Optional[int] = None,
 ) -> Sequence[DltResource]:
     """Get stargazers in the repo `name` with owner `owner`.
 
@@ -130,10 +248,40 @@ def github_stargazers(
         access_token (str): The classic access token. Will be injected from secrets if not provided.
         items_per_page (int, optional): How many issues/pull requests to get in single page. Defaults to 100.
         max_items (int, optional): How many issues/pull requests to get in total. None means All.
+        incremental (bool, optional): Merge stars given since the last load instead of replacing everything. Defaults to False.
+        starred_since (str, optional): Initial high-water mark for incremental loads, e.g. the latest `starred_at` in the destination.
+        batch_pages (int, optional): For full loads, fetch at most this many pages per pipeline run and checkpoint the pagination in the resource state.
 
     Returns:
         Sequence[DltResource]: One DltResource: `stargazers`
     """
+    if incremental:
+        @dlt.resource(name="stargazers", write_disposition="merge", primary_key="user__login")
+        def stargazers(
+            starred_at: dlt.sources.incremental[str] = dlt.sources.incremental(
+                "starredAt", initial_value=starred_since or START_DATE
+            ),
+        ) -> Iterator[TDataItems]:
+            yield from get_stargazers(
+                owner,
+                name,
+                access_token,
+                items_per_page,
+                max_items,
+                since=_since(starred_at),
+            )
+
+        return (stargazers,)
+
+    if batch_pages:
+        return (
+            _checkpointed_resource(
+                "stargazers",
+                lambda checkpoint: get_stargazers(owner, name, access_token, items_per_page, max_items, checkpoint=checkpoint),
+                batch_pages,
+            ),
+        )
+
     return (
         dlt.resource(
             get_stargazers(
@@ -156,6 +304,10 @@ def github_commits(
     access_token: str = dlt.secrets.value,
     items_per_page: int = 100,
     max_items: Optional[int] = None,
+    incremental: bool = False,
+    committed_since: Optional[str] = None,
+    partitioned: bool = False,
+    batch_pages: Optional[int] = None,
 ) -> Sequence[DltResource]:
     """Get commits in the repo `name` with owner `owner`.
 
@@ -169,13 +321,62 @@ def github_commits(
         access_token (str): The classic access token. Will be injected from secrets if not provided.
         items_per_page (int, optional): How many commits to get in single page. Defaults to 100.
         max_items (int, optional): How many commits to get in total. None means All.
+        incremental (bool, optional): Merge commits made since the last load instead of replacing everything. Defaults to False.
+        committed_since (str, optional): Initial high-water mark for incremental loads, e.g. the latest `committed_date` in the destination.
+        partitioned (bool, optional): Fetch a full load as concurrent `since`/`until` windows of the history. Defaults to False.
+        batch_pages (int, optional): For full loads, fetch at most this many pages per pipeline run and checkpoint the pagination in the resource state.
+            Partitioned loads fetch whole partitions per run instead and checkpoint the completed ones. Commits on partition boundaries
+            can be fetched in two runs, so batches after the first should be merged on `oid`.
 
     Returns:
         Sequence[DltResource]: One DltResource: `commits`
     """
+    if incremental:
+        @dlt.resource(name="commits", write_disposition="merge", primary_key="oid")
+        def commits(
+            committed_date: dlt.sources.incremental[str] = dlt.sources.incremental(
+                "committedDate", initial_value=committed_since or START_DATE
+            ),
+        ) -> Iterator[TDataItems]:
+            yield from get_commits(
+                owner,
+                name,
+                access_token,
+                items_per_page,
+                max_items,
+                since=_since(committed_date),
+            )
+
+        return (commits,)
+
+    if batch_pages and partitioned:
+        # batches are whole partitions, about as many commits as `batch_pages` pages but at least one per worker
+        max_partitions = max(COMMITS_PARTITION_WORKERS, batch_pages * items_per_page // COMMITS_MAX_PARTITION_SIZE)
+
+        @dlt.resource(name="commits", write_disposition="append", primary_key="oid")
+        def partitions() -> Iterator[TDataItems]:
+            state = dlt.current.resource_state()
+            checkpoint = state.setdefault("checkpoint", {})
+            yield from get_commits_partitioned(
+                owner, name, access_token, items_per_page, max_items, checkpoint=checkpoint, max_partitions=max_partitions
+            )
+            if len(checkpoint["done"]) == len(checkpoint["partitions"]) or (max_items and checkpoint["items_count"] >= max_items):
+                state.pop("checkpoint", None)
+
+        return (partitions,)
+
+    if batch_pages:
+        return (
+            _checkpointed_resource(
+                "commits",
+                lambda checkpoint: get_commits(owner, name, access_token, items_per_page, max_items, checkpoint=checkpoint),
+                batch_pages,
+            ),
+        )
+
     return (
         dlt.resource(
-            get_commits(
+            (get_commits_partitioned if partitioned else get_commits)(
                 owner,
                 name,
                 access_token,
@@ -1,11 +1,51 @@
-from typing import Iterator, List, Optional, Tuple
+import json
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Iterator, List, Optional, Tuple
 
+from dlt.common import pendulum
 from dlt.common.typing import DictStrAny, StrAny
-from dlt.common.utils import chunks
 from dlt.sources.helpers import requests
 
-from .queries import COMMENT_REACTIONS_QUERY, ISSUES_QUERY, STARGAZERS_QUERY, RATE_LIMIT, COMMITS_QUERY
-from .settings import GRAPHQL_API_BASE_URL, REST_API_BASE_URL
+from .queries import (
+    COMMENT_REACTIONS_QUERY,
+    COMMITS_LEAN_QUERY,
+    COMMITS_QUERY,
+    COMMITS_WINDOW_COUNT_QUERY,
+    ISSUES_LEAN_QUERY,
+    ISSUES_QUERY,
+    MORE_COMMENTS_QUERY,
+    RATE_LIMIT,
+    STARGAZERS_LEAN_QUERY,
+    STARGAZERS_QUERY,
+)
+from .projection import lean_fields
+from .http_client import get_http_client
+from .rate_limit import adapt_page_size, get_budget, get_scheduler, query_shape_key
+from .retry import get_retry_policy
+from .streaming import parse_graphql_stream, streaming_available
+from .token_pool import get_token_pool
+from .settings import (
+    COMMENTS_BATCH_SIZE,
+    COMMITS_MAX_PARTITION_SIZE,
+    COMMITS_PARTITION_WORKERS,
+    FIRST_COMMENTS,
+    ENRICH_REACTIONS,
+    INGESTION_PROFILE,
+    GRAPHQL_API_BASE_URL,
+    GRAPHQL_MAX_PAGE_SIZE,
+    GRAPHQL_MIN_PAGE_SIZE,
+    REACTIONS_BATCH_SIZE,
+    REACTIONS_WORKERS,
+    REST_API_BASE_URL,
+    STREAM_CHUNK_ITEMS,
+    STREAM_SPOOL_MAX_BYTES,
+    STREAM_RESPONSES,
+)
 
 
 #
@@ -24,7 +64,20 @@ def _get_auth_header(access_token: Optional[str]) -> StrAny:
 #
 def get_rest_pages(access_token: Optional[str], query: str) -> Iterator[List[StrAny]]:
     def _request(page_url: str) -> requests.Response:
-        r = requests.get(page_url, headers=_get_auth_header(access_token))
+        policy = get_retry_policy()
+        attempt = 0
+        while True:
+            policy.record_request()
+            started = time.monotonic()
+            try:
+                r = get_http_client().get(page_url, headers=_get_auth_header(access_token))
+                break
+            except Exception as e:
+                decision = policy.classify(e, None, attempt)
+                if decision is None:
+                    raise
+                policy.wait(decision, attempt, time.monotonic() - started)
+                attempt += 1
         print(
             f"got page {page_url}, requests left: " + r.headers["x-ratelimit-remaining"]
         )
@@ -45,21 +98,51 @@ def get_rest_pages(access_token: Optional[str], query: str) -> Iterator[List[Str
 #
 # GraphQL API helpers
 #
+def _lean(table: str) -> bool:
+    """The lean profile only fetches what the semantic layer reads, `full` also gets bodies, messages and comments"""
+    if INGESTION_PROFILE == "full":
+        return False
+    # the reaction enrichment reads the comments, which only the full profile fetches
+    return not (ENRICH_REACTIONS and table in ("issues", "pull_requests"))
+
+
+def _issues_query(node_type: str, order_field: str) -> str:
+    table = "issues" if node_type == "issues" else "pull_requests"
+    if _lean(table):
+        return ISSUES_LEAN_QUERY % (node_type, order_field, lean_fields(table))
+    return ISSUES_QUERY % (node_type, order_field)
+
+
+def _commits_query() -> str:
+    return COMMITS_LEAN_QUERY % lean_fields("commits") if _lean("commits") else COMMITS_QUERY
+
+
 def get_stargazers(
     owner: str,
     name: str,
     access_token: str,
     items_per_page: int,
     max_items: Optional[int],
+    since: Optional[str] = None,
+    checkpoint: Optional[DictStrAny] = None,
 ) -> Iterator[Iterator[StrAny]]:
+    """Stargazers ordered by `starredAt`, newest first. With `since`, stops paginating once older stars are reached."""
     variables = {"owner": owner, "name": name, "items_per_page": items_per_page}
+    query = STARGAZERS_LEAN_QUERY % lean_fields("stargazers") if _lean("stargazers") else STARGAZERS_QUERY
     for page_items in _get_graphql_pages(
-        access_token, STARGAZERS_QUERY, variables, "stargazers", max_items
+        access_token, query, variables, "stargazers", max_items, checkpoint
     ):
-        yield map(
-            lambda item: {"starredAt": item["starredAt"], "user": item["node"]},
-            page_items,
-        )
+        yield map(_stargazer_row, page_items)
+        if since and _is_older(page_items[-1]["starredAt"], since):
+            print(f"Reached stargazers starred before {since}")
+            return
+
+
+def _stargazer_row(edge: StrAny) -> StrAny:
+    """Row of a stargazer edge. `user__login` is a top level key, as incremental loads deduplicate the raw
+    rows by the primary key, and normalizes to the same column as the other `user` fields."""
+    user = dict(edge["node"])
+    return {"starredAt": edge["starredAt"], "user__login": user.pop("login"), "user": user}
 
 
 def get_reactions_data(
@@ -69,37 +152,80 @@ def get_reactions_data(
     access_token: str,
     items_per_page: int,
     max_items: Optional[int],
+    since: Optional[str] = None,
+    checkpoint: Optional[DictStrAny] = None,
 ) -> Iterator[Iterator[StrAny]]:
+    """Issues or pull requests, newest first. With `since`, items are ordered by `updatedAt` and
+    pagination stops at the first item not updated since then."""
     variables = {
         "owner": owner,
         "name": name,
         "issues_per_page": items_per_page,
-        "first_reactions": 100,
-        "first_comments": 100,
-        "node_type": node_type,
     }
+    lean = _lean("issues" if node_type == "issues" else "pull_requests")
+    if not lean:
+        variables["first_comments"] = FIRST_COMMENTS
+    if INGESTION_PROFILE != "full" and not lean:
+        print(f"Comment reaction enrichment is enabled, loading {node_type} with the full ingestion profile")
+    order_field = "UPDATED_AT" if since else "CREATED_AT"
     for page_items in _get_graphql_pages(
-        access_token, ISSUES_QUERY % node_type, variables, node_type, max_items
+        access_token, _issues_query(node_type, order_field), variables, node_type, max_items, checkpoint
     ):
-        # use reactionGroups to query for reactions to comments that have any reactions. reduces cost by 10-50x
-        reacted_comment_ids = {}
+        if lean:
+            yield page_items
+            if since and _is_older(page_items[-1]["updatedAt"], since):
+                print(f"Reached {node_type} not updated since {since}")
+                return
+            continue
+        # the first pass only gets the first comments of every item, fetch the rest of the long threads
+        _get_remaining_comments(node_type, owner, name, access_token, page_items)
+        # use reactionGroups to flag comments that have any reactions. the reactions themselves are fetched
+        # for the flagged comments only, by the optional enrichment stage (see get_comment_reactions)
         for item in page_items:
             for comment in item["comments"]["nodes"]:
-                if any(group["createdAt"] for group in comment["reactionGroups"]):
-                    # print(f"for comment {comment['id']}: has reaction")
-                    reacted_comment_ids[comment["id"]] = comment
-                # if "reactionGroups" in comment:
-                comment.pop("reactionGroups", None)
-
-        # get comment reactions by querying comment nodes separately
-        """comment_reactions = _get_comment_reaction(
-            list(reacted_comment_ids.keys()), access_token
-        )
-        # attach the reaction nodes where they should be
-        for comment in comment_reactions.values():
-            comment_id = comment["id"]
-            reacted_comment_ids[comment_id]["reactions"] = comment["reactions"]"""
+                comment["has_reactions"] = any(group["createdAt"] for group in comment.pop("reactionGroups", None) or [])
         yield map(_extract_nested_nodes, page_items)
+        if since and _is_older(page_items[-1]["updatedAt"], since):
+            print(f"Reached {node_type} not updated since {since}")
+            return
+
+
+def _get_remaining_comments(
+    node_type: str,
+    owner: str,
+    name: str,
+    access_token: str,
+    items: List[DictStrAny],
+    batch_size: int = COMMENTS_BATCH_SIZE,
+) -> None:
+    """Appends the comments beyond the first page to the items that have more, using aliased
+    multi-item queries with up to `batch_size` items and 100 comments per item each."""
+    field = "issue" if node_type == "issues" else "pullRequest"
+    pending = {
+        item["number"]: item
+        for item in items
+        if item["comments"].get("pageInfo", {}).get("hasNextPage")
+    }
+    if pending:
+        print(f"Fetching more comments for {len(pending)} {node_type}")
+    while pending:
+        batch = list(pending.values())[:batch_size]
+        subs = [
+            MORE_COMMENTS_QUERY % (item["number"], field, item["number"], json.dumps(item["comments"]["pageInfo"]["endCursor"]))
+            for item in batch
+        ]
+        query = "query($owner: String!, $name: String!) {" + ",\n".join(subs) + RATE_LIMIT + "}"
+        data, rate_limit = _run_graphql_query(access_token, query, {"owner": owner, "name": name})
+        for item in batch:
+            comments = ((data.get(f"item_{item['number']}") or {}).get(field) or {}).get("comments")
+            if not comments:
+                # the item was deleted or moved since the first pass
+                pending.pop(item["number"])
+                continue
+            item["comments"]["nodes"].extend(comments["nodes"])
+            item["comments"]["pageInfo"] = comments["pageInfo"]
+            if not comments["pageInfo"]["hasNextPage"]:
+                pending.pop(item["number"])
 
 
 def get_commits(
@@ -108,19 +234,192 @@ def get_commits(
     access_token: str,
     items_per_page: int,
     max_items: Optional[int],
+    since: Optional[str] = None,
+    checkpoint: Optional[DictStrAny] = None,
 ) -> Iterator[Iterator[StrAny]]:
+    """Commits reachable from HEAD. With `since`, only commits made after it are requested."""
     variables = {
         "owner": owner,
         "name": name,
-        "items_per_page": items_per_page
+        "items_per_page": items_per_page,
+        "since": since,
     }
     
     for page_items in _get_graphql_pages(
-        access_token, COMMITS_QUERY, variables, "object/history", max_items
+        access_token, _commits_query(), variables, "object/history", max_items, checkpoint
     ):
         yield map(lambda item: item, page_items)
 
 
+def get_commits_partitioned(
+    owner: str,
+    name: str,
+    access_token: str,
+    items_per_page: int,
+    max_items: Optional[int],
+    since: Optional[str] = None,
+    max_partition_commits: int = COMMITS_MAX_PARTITION_SIZE,
+    workers: int = COMMITS_PARTITION_WORKERS,
+    checkpoint: Optional[DictStrAny] = None,
+    max_partitions: Optional[int] = None,
+) -> Iterator[List[StrAny]]:
+    """Commits reachable from HEAD, fetched as concurrent `since`/`until` windows.
+
+    History is split by year from the repository creation (commits older than that form one extra window)
+    and windows with more than `max_partition_commits` commits are halved until they fit. Pages are yielded
+    as they arrive, deduplicated by `oid` since window boundaries are inclusive.
+
+    A `checkpoint` dict keeps the windows and the ones whose commits were all yielded. It is resumed from,
+    and with `max_partitions` only that many of the remaining windows are fetched.
+    """
+    if checkpoint and checkpoint.get("partitions"):
+        partitions = [
+            (pendulum.parse(start) if start else None, pendulum.parse(end) if end else None)
+            for start, end in checkpoint["partitions"]
+        ]
+        print(f"Resuming commits of {owner}/{name} after {len(checkpoint['done'])} of {len(partitions)} partitions")
+    else:
+        partitions = _commit_partitions(owner, name, access_token, since, max_partition_commits)
+        if checkpoint is not None:
+            checkpoint.update(
+                partitions=[[start.isoformat() if start else None, end.isoformat() if end else None] for start, end in partitions],
+                done=[],
+                items_count=0,
+            )
+    done = set(checkpoint["done"]) if checkpoint is not None else set()
+    todo = [index for index in range(len(partitions)) if index not in done][:max_partitions]
+    print(f"Fetching commits of {owner}/{name} in {len(todo)} partitions with {workers} workers")
+
+    pages: "queue.Queue[Tuple[str, object]]" = queue.Queue(maxsize=workers * 2)
+    stop = threading.Event()
+
+    def fetch(index: int) -> None:
+        window = partitions[index]
+        started = time.monotonic()
+        count = 0
+        try:
+            variables = {
+                "owner": owner,
+                "name": name,
+                "items_per_page": items_per_page,
+                "since": window[0].isoformat() if window[0] else None,
+                "until": window[1].isoformat() if window[1] else None,
+            }
+            for page_items in _get_graphql_pages(access_token, _commits_query(), variables, "object/history", None):
+                if stop.is_set():
+                    return
+                count += len(page_items)
+                pages.put(("page", page_items))
+            seconds = time.monotonic() - started
+            print(
+                f"Partition {window[0]} - {window[1]}: {count} commits in {seconds:.1f}s "
+                f"({count / seconds if seconds else 0:.0f} commits/s)"
+            )
+            pages.put(("done", index))
+        except Exception as e:
+            pages.put(("error", e))
+
+    seen_oids = set()
+    items_count = checkpoint.get("items_count", 0) if checkpoint is not None else 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for index in todo:
+            executor.submit(fetch, index)
+        try:
+            pending = len(todo)
+            while pending:
+                kind, payload = pages.get()
+                if kind == "error":
+                    raise payload
+                if kind == "done":
+                    pending -= 1
+                    # the pages of a partition are queued before it is done, so they were all yielded
+                    if checkpoint is not None:
+                        checkpoint["done"].append(payload)
+                        checkpoint["items_count"] = items_count
+                    continue
+                new_items = [item for item in payload if item["oid"] not in seen_oids]
+                seen_oids.update(item["oid"] for item in new_items)
+                if new_items:
+                    items_count += len(new_items)
+                    yield new_items
+                if max_items and items_count >= max_items:
+                    print(f"Max items limit reached: {items_count} >= {max_items}")
+                    return
+        finally:
+            stop.set()
+            # unblock producers waiting on a full queue
+            while not pages.empty():
+                pages.get_nowait()
+
+
+def _commit_partitions(
+    owner: str,
+    name: str,
+    access_token: str,
+    since: Optional[str],
+    max_partition_commits: int,
+) -> List[Tuple[Optional[pendulum.DateTime], Optional[pendulum.DateTime]]]:
+    """Yearly windows of the history, split until each holds at most `max_partition_commits` commits"""
+    created_at = pendulum.parse(
+        _run_graphql_query(access_token, COMMITS_WINDOW_COUNT_QUERY, {"owner": owner, "name": name})[0]["repository"]["createdAt"]
+    )
+    start = max(created_at, pendulum.parse(since)) if since else created_at
+    now = pendulum.now("UTC")
+
+    windows: List[Tuple[Optional[pendulum.DateTime], Optional[pendulum.DateTime]]] = []
+    if not since or pendulum.parse(since) < created_at:
+        windows.append((pendulum.parse(since) if since else None, created_at))
+    year_start = start
+    while year_start < now:
+        year_end = min(year_start.add(years=1), now)
+        windows.append((year_start, year_end))
+        year_start = year_end
+    # commits with dates in the future (bad clocks) land in an open ended window
+    windows[-1] = (windows[-1][0], None)
+
+    partitions = []
+    for window in windows:
+        partitions.extend(_split_commit_window(owner, name, access_token, window, max_partition_commits))
+    return partitions
+
+
+def _split_commit_window(
+    owner: str,
+    name: str,
+    access_token: str,
+    window: Tuple[Optional[pendulum.DateTime], Optional[pendulum.DateTime]],
+    max_partition_commits: int,
+) -> List[Tuple[Optional[pendulum.DateTime], Optional[pendulum.DateTime]]]:
+    """Halves a window until each part holds at most `max_partition_commits` commits. Empty windows are dropped."""
+    since, until = window
+    data, _ = _run_graphql_query(
+        access_token,
+        COMMITS_WINDOW_COUNT_QUERY,
+        {
+            "owner": owner,
+            "name": name,
+            "since": since.isoformat() if since else None,
+            "until": until.isoformat() if until else None,
+        },
+    )
+    total = data["repository"]["object"]["history"]["totalCount"]
+    if total == 0:
+        return []
+    # open ended windows and windows shorter than a day are not split further
+    if total <= max_partition_commits or since is None or until is None or (until - since).in_hours() < 24:
+        return [window]
+    middle = since.add(seconds=int((until - since).total_seconds() / 2))
+    return (
+        _split_commit_window(owner, name, access_token, (since, middle), max_partition_commits)
+        + _split_commit_window(owner, name, access_token, (middle, until), max_partition_commits)
+    )
+
+
+def _is_older(timestamp: str, since: str) -> bool:
+    """Compares GitHub ISO timestamps, which may or may not carry fractional seconds"""
+    return pendulum.parse(timestamp) < pendulum.parse(since)
+
+
 def _extract_top_connection(data: StrAny, node_type: str) -> StrAny:
     """Modified to handle nested paths like 'object/history'"""
     assert isinstance(data, dict), f"The data with list of {node_type} must be a dictionary"
@@ -151,91 +450,334 @@ def _extract_nested_nodes(item: DictStrAny) -> DictStrAny:
     return item
 
 
+def _shrink_page(variables: DictStrAny) -> None:
+    """Halves the page size of a query that timed out, `_get_graphql_pages` grows it back when pages get cheap"""
+    for key in ("issues_per_page", "items_per_page"):
+        if key in variables and variables[key] > 1:
+            variables[key] = max(1, variables[key] // 2)
+            print(f"Query timed out, reducing {key} to {variables[key]}")
+            return
+
+
+# GraphQL error types of a token that can't see the repository, e.g. a pooled token and a private repo
+REPO_ACCESS_ERRORS = {"NOT_FOUND", "FORBIDDEN"}
+
+
+def _lacks_repo_access(token: str, access_token: str, errors: list) -> bool:
+    """Whether a pooled token failed for lack of access, so the request should be sent with the run's own token.
+    The pooled token stays in the pool, it can still load public repositories."""
+    if not access_token or token == access_token or not any(e.get("type") in REPO_ACCESS_ERRORS for e in errors):
+        return False
+    print(f"GitHub token ...{token[-4:]} has no access to the repository, retrying with the token the run was started with")
+    return True
+
+
+def _retry_failed_request(
+    error: Optional[Exception], errors: Optional[list], token: str, scheduler, attempt: int, started: float, variables: DictStrAny
+) -> int:
+    """Waits before retrying a failed request and returns the next attempt number. Raises when it should not be retried."""
+    response = getattr(error, 'response', None)
+    if response is not None and response.status_code == 401:
+        # revoked tokens fail over to the next one in the pool, which is not another attempt
+        get_token_pool().revoke(token)
+        return attempt
+    policy = get_retry_policy()
+    decision = policy.classify(error, errors, attempt)
+    if decision is None:
+        if error is None:
+            raise ValueError({"errors": errors})
+        print(f"GraphQL request failed: {error}")
+        if response is not None:
+            print(f"Server response: {response.text}")
+        raise error
+    if decision.reason == "graphql_rate_limited" and scheduler.reset_at:
+        # the primary limit is exhausted, waiting for the reset is the only thing that helps
+        decision.delay = max(decision.delay, scheduler.reset_at - time.time() + 1)
+    policy.wait(decision, attempt, time.monotonic() - started)
+    if decision.shrink_page:
+        _shrink_page(variables)
+    return attempt + 1
+
+
 def _run_graphql_query(
     access_token: str, query: str, variables: DictStrAny
 ) -> Tuple[StrAny, StrAny]:
-    def _request() -> requests.Response:
-        while True:
-            try:
-                r = requests.post(
+    query_key = query_shape_key(query)
+    attempt = 0
+    own_token = False
+    while True:
+        # every page goes to the token with the most credits left, revoked tokens fail over to the next one
+        token = access_token if own_token else get_token_pool().choose(query_key, access_token)
+        budget = get_budget(token)
+        scheduler = get_scheduler(token)
+        reserved = scheduler.before(query_key)
+        get_retry_policy().record_request()
+        started = time.monotonic()
+        try:
+            with budget.request():
+                data = get_http_client().post(
                     GRAPHQL_API_BASE_URL,
                     json={"query": query, "variables": variables},
-                    headers=_get_auth_header(access_token),
-                )
-                return r
-                
-            except Exception as e:
-                import traceback
-                if hasattr(e, 'response') and e.response.status_code == 403:
-                    if 'Retry-After' in e.response.headers:
-                        retry_after = int(e.response.headers['Retry-After'])
-                        wait_time = retry_after * 1.5
-                        print(f"Rate limit hit. Waiting for {wait_time} seconds (1.5x the Retry-After value)")
-                        import time
-                        time.sleep(wait_time)
-                        continue
-                    print(f"403 Forbidden Error. Server response: {e.response.text}")
-                    print(f"header: {e.response.headers}")
-                else:
-                    print(f"Error: {str(e)}")
-                print("Stack trace:")
-                print(traceback.format_exc())
+                    headers=_get_auth_header(token),
+                ).json()
+        except Exception as e:
+            scheduler.release(reserved)
+            attempt = _retry_failed_request(e, None, token, scheduler, attempt, started, variables)
+            continue
+
+        if "errors" in data:
+            scheduler.release(reserved)
+            if _lacks_repo_access(token, access_token, data["errors"]):
+                own_token = True
+                continue
+            attempt = _retry_failed_request(None, data["errors"], token, scheduler, attempt, started, variables)
+            continue
+
+        data = data["data"]
+        # pop rate limits
+        rate_limit = data.pop("rateLimit", {"cost": 0, "remaining": 0})
+        scheduler.after(query_key, reserved, rate_limit)
+        budget.record(rate_limit.get("cost"))
+        return data, rate_limit
+
+
+def _download_graphql_page(token: str, query: str, variables: DictStrAny) -> BinaryIO:
+    """Posts the query and spools the response body to a temporary file, in memory up to `STREAM_SPOOL_MAX_BYTES`"""
+    spool = tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_MAX_BYTES)
+    try:
+        with get_http_client().stream(
+            "POST",
+            GRAPHQL_API_BASE_URL,
+            json={"query": query, "variables": variables},
+            headers=_get_auth_header(token),
+        ) as body:
+            shutil.copyfileobj(body, spool, 64 * 1024)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def _stream_graphql_page(
+    access_token: str, query: str, variables: DictStrAny, node_type: str, chunk_size: int
+) -> Iterator[Tuple[str, object]]:
+    """Like `_run_graphql_query`, but parses the response incrementally and yields `("page_info", ...)`,
+    `("nodes", [...])` chunks of up to `chunk_size` nodes and finally `("rate_limit", ...)`.
+
+    The body is spooled while the request holds its concurrency slot and the connection, and parsed
+    after both were released, so slow consumers of the chunks don't block other requests of the token.
+    Failures are retried until the first chunk was yielded, later ones are raised."""
+    query_key = query_shape_key(query)
+    attempt = 0
+    own_token = False
+    while True:
+        token = access_token if own_token else get_token_pool().choose(query_key, access_token)
+        budget = get_budget(token)
+        scheduler = get_scheduler(token)
+        reserved = scheduler.before(query_key)
+        get_retry_policy().record_request()
+        started = time.monotonic()
+        try:
+            with budget.request():
+                spool = _download_graphql_page(token, query, variables)
+        except Exception as e:
+            scheduler.release(reserved)
+            attempt = _retry_failed_request(e, None, token, scheduler, attempt, started, variables)
+            continue
+
+        yielded = False
+        rate_limit: Optional[StrAny] = None
+        errors = None
+        try:
+            with spool:
+                chunk: List[DictStrAny] = []
+                for kind, value in parse_graphql_stream(spool, node_type):
+                    if kind == "node":
+                        if value is not None:
+                            chunk.append(value)
+                        if len(chunk) >= chunk_size:
+                            yielded = True
+                            yield "nodes", chunk
+                            chunk = []
+                    elif kind == "page_info":
+                        yield "page_info", value
+                    elif kind == "rate_limit":
+                        rate_limit = value
+                    elif kind == "errors":
+                        errors = value
+                if errors is None and chunk:
+                    yielded = True
+                    yield "nodes", chunk
+        except GeneratorExit:
+            # the caller stopped reading the page, e.g. at the `since` high-water mark
+            scheduler.release(reserved)
+            raise
+        except Exception as e:
+            scheduler.release(reserved)
+            if yielded:
                 raise
+            attempt = _retry_failed_request(e, None, token, scheduler, attempt, started, variables)
+            continue
 
-    
-    data = _request().json()
-    if "errors" in data:
-        raise ValueError(data)
-    data = data["data"]
-    # pop rate limits
-    rate_limit = data.pop("rateLimit", {"cost": 0, "remaining": 0})
-    return data, rate_limit
+        if errors is not None:
+            scheduler.release(reserved)
+            if yielded:
+                raise ValueError({"errors": errors})
+            if _lacks_repo_access(token, access_token, errors):
+                own_token = True
+                continue
+            attempt = _retry_failed_request(None, errors, token, scheduler, attempt, started, variables)
+            continue
+
+        rate_limit = rate_limit or {"cost": 0, "remaining": 0}
+        scheduler.after(query_key, reserved, rate_limit)
+        budget.record(rate_limit.get("cost"))
+        yield "rate_limit", rate_limit
+        return
+
+
+def _graphql_page(access_token: str, query: str, variables: DictStrAny, node_type: str) -> Iterator[Tuple[str, object]]:
+    """`_stream_graphql_page` for a response parsed at once, all nodes come in one chunk"""
+    data, rate_limit = _run_graphql_query(access_token, query, variables)
+    top_connection = _extract_top_connection(data, node_type)
+    yield "page_info", top_connection["pageInfo"]
+    nodes = top_connection["nodes"] if "nodes" in top_connection else top_connection["edges"]
+    yield "nodes", [node for node in nodes if node is not None]
+    yield "rate_limit", rate_limit
 
 
 def _get_graphql_pages(
-    access_token: str, query: str, variables: DictStrAny, node_type: str, max_items: int
+    access_token: str, query: str, variables: DictStrAny, node_type: str, max_items: int, checkpoint: Optional[DictStrAny] = None
 ) -> Iterator[List[DictStrAny]]:
+    """Yields lists of `node_type` items: whole pages, or chunks of `STREAM_CHUNK_ITEMS` nodes when responses are streamed.
+
+    A `checkpoint` dict is resumed from and updated before each list is yielded, so it always points past
+    the yielded data: the cursor of the page, the items of that page already yielded and the total count.
+    Once the last list of a page is yielded, it points to the start of the next page with `page_offset` 0.
+    """
     items_count = 0
+    # items of the current page that were loaded before a resume
+    skip = 0
+    # the page size the caller asked for is the upper bound when adapting it to the query cost
+    page_size_key = next((key for key in ("issues_per_page", "items_per_page") if key in variables), None)
+    max_page_size = variables[page_size_key] if page_size_key else None
+    if checkpoint:
+        print(f"Resuming {node_type} after {checkpoint.get('items_count', 0)} items")
+        variables["page_after"] = checkpoint.get("page_after")
+        items_count = checkpoint.get("items_count", 0)
+        skip = checkpoint.get("page_offset", 0)
+        if page_size_key and skip:
+            # the resumed page has to reach past the items loaded before
+            # GitHub serves at most 100 items per page
+            variables[page_size_key] = min(GRAPHQL_MAX_PAGE_SIZE, max(variables[page_size_key], checkpoint.get("page_size") or 0, skip + 1))
+    stream = STREAM_RESPONSES and streaming_available()
     while True:
-        data, rate_limit = _run_graphql_query(access_token, query, variables)
-        top_connection = _extract_top_connection(data, node_type)
-        data_items = (
-            top_connection["nodes"]
-            if "nodes" in top_connection
-            else top_connection["edges"]
-        )
-        items_count += len(data_items)
+        page_after = variables.get("page_after")
+        page_size = variables.get(page_size_key) if page_size_key else None
+        if stream:
+            events = _stream_graphql_page(access_token, query, variables, node_type, STREAM_CHUNK_ITEMS)
+        else:
+            events = _graphql_page(access_token, query, variables, node_type)
+
+        end_cursor = None
+        rate_limit: StrAny = {"cost": 0, "remaining": 0}
+        position = 0
+        # a chunk is held back until the next one arrives, so the last chunk of a page is checkpointed
+        # with the cursor of the next page instead of an offset at the end of this one
+        pending: Optional[List[DictStrAny]] = None
+        for kind, value in events:
+            if kind == "page_info":
+                end_cursor = value["endCursor"]
+            elif kind == "rate_limit":
+                rate_limit = value
+            else:
+                start = position
+                position += len(value)
+                data_items = value[max(0, skip - start):]
+                if not data_items:
+                    continue
+                if pending is not None:
+                    yield pending
+                items_count += len(data_items)
+                if checkpoint is not None:
+                    checkpoint.update(page_after=page_after, page_offset=position, page_size=page_size, items_count=items_count)
+                pending = data_items
+
+        if checkpoint is not None and position:
+            checkpoint.update(page_after=end_cursor, page_offset=0, page_size=page_size, items_count=items_count)
+        if pending is not None:
+            yield pending
         print(
-            f'Got {len(data_items)}/{items_count} {node_type}s, query cost {rate_limit["cost"]}, remaining credits: {rate_limit["remaining"]}'
+            f'Got {position}/{items_count} {node_type}s, query cost {rate_limit["cost"]}, remaining credits: {rate_limit["remaining"]}'
         )
-        if data_items:
-            yield data_items
-        else:
+        if not position:
             return
-        # print(data["repository"][node_type]["pageInfo"]["endCursor"])
-        variables["page_after"] = _extract_top_connection(data, node_type)["pageInfo"][
-            "endCursor"
-        ]
+        skip = 0
+        variables["page_after"] = end_cursor
         if max_items and items_count >= max_items:
             print(f"Max items limit reached: {items_count} >= {max_items}")
             return
+        if page_size_key:
+            page_size = adapt_page_size(
+                variables[page_size_key], rate_limit.get("cost"), min(GRAPHQL_MIN_PAGE_SIZE, max_page_size), max_page_size
+            )
+            if page_size != variables[page_size_key]:
+                print(f"Query cost {rate_limit.get('cost')}, changing {node_type} page size to {page_size}")
+                variables[page_size_key] = page_size
+
 
+def get_comment_reactions(
+    comment_ids: List[str],
+    access_token: str,
+    batch_size: int = REACTIONS_BATCH_SIZE,
+    workers: int = REACTIONS_WORKERS,
+) -> Iterator[List[StrAny]]:
+    """Reactions of the given comments, queried as batches of aliased `node(id:)` lookups.
 
-def _get_comment_reaction(comment_ids: List[str], access_token: str) -> StrAny:
+    `workers` batches are in flight at a time, sharing the token budgets with any running loads. The batch
+    size is adapted to the cost GitHub reports, between 1 and 100 nodes per query.
+    """
+    remaining = list(comment_ids)
+    max_batch_size = batch_size
+    print(f"Fetching reactions of {len(remaining)} comments with {workers} workers")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while remaining:
+            batches = []
+            while remaining and len(batches) < workers:
+                batches.append(remaining[:batch_size])
+                remaining = remaining[batch_size:]
+            costs = []
+            for page, rate_limit in executor.map(lambda batch: _get_comment_reaction(batch, access_token), batches):
+                costs.append(rate_limit.get("cost"))
+                rows = []
+                for node in page.values():
+                    # comments deleted since the load come back as null
+                    if not node:
+                        continue
+                    for reaction in node["reactions"]["nodes"]:
+                        rows.append({
+                            "comment_id": node["id"],
+                            "content": reaction["content"],
+                            "createdAt": reaction["createdAt"],
+                            # deleted accounts are shown as ghost by GitHub
+                            "user": reaction["user"] or {"login": "ghost"},
+                        })
+                if rows:
+                    yield rows
+            cost = max(c for c in costs if c is not None) if any(c is not None for c in costs) else None
+            batch_size = adapt_page_size(batch_size, cost, 1, max_batch_size)
+
+
+def _get_comment_reaction(comment_ids: List[str], access_token: str) -> Tuple[StrAny, StrAny]:
     """Builds a query from a list of comment nodes and returns associated reactions."""
-    idx = 0
-    data: DictStrAny = {}
-    for page_chunk in chunks(comment_ids, 50):
-        subs = []
-        for comment_id in page_chunk:
-            subs.append(COMMENT_REACTIONS_QUERY % (idx, comment_id))
-            idx += 1
-        subs.append(RATE_LIMIT)
-        query = "{" + ",\n".join(subs) + "}"
-        # print(query)
-        page, rate_limit = _run_graphql_query(access_token, query, {})
-        print(
-            f'Got {len(page)} comments, query cost {rate_limit["cost"]}, remaining credits: {rate_limit["remaining"]}'
-        )
-        data.update(page)
-    return data
+    subs = []
+    for idx, comment_id in enumerate(comment_ids):
+        subs.append(COMMENT_REACTIONS_QUERY % (idx, comment_id))
+    subs.append(RATE_LIMIT)
+    query = "{" + ",\n".join(subs) + "}"
+    page, rate_limit = _run_graphql_query(access_token, query, {})
+    print(
+        f'Got {len(page)} comments, query cost {rate_limit["cost"]}, remaining credits: {rate_limit["remaining"]}'
+    )
+    return page, rate_limit
@@ -0,0 +1,233 @@
+"""Shared keep-alive HTTP clients for the GitHub REST and GraphQL APIs."""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from dlt.sources.helpers import requests
+from requests.adapters import HTTPAdapter
+
+from .settings import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_CONNECTIONS_PER_HOST,
+    HTTP_POOL_SIZE,
+    HTTP_READ_TIMEOUT,
+)
+
+
+class HttpStats:
+    """Request, byte and latency counters of a client"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self.bytes_on_wire = 0
+        self.latency_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, bytes_received: int, bytes_on_wire: int, error: bool = False) -> None:
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.bytes_received += bytes_received
+            self.bytes_on_wire += bytes_on_wire
+            self.latency_seconds += latency
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "bytes_received": self.bytes_received,
+                "bytes_on_wire": self.bytes_on_wire,
+                "latency_seconds": round(self.latency_seconds, 3),
+                "avg_latency_ms": round(1000 * self.latency_seconds / self.requests, 1) if self.requests else 0,
+            }
+
+
+def stats_delta(before: Dict[str, float], after: Dict[str, float]) -> Dict[str, float]:
+    """Counters accumulated between two snapshots"""
+    delta = {key: after[key] - before[key] for key in ("requests", "errors", "bytes_received", "bytes_on_wire")}
+    latency = after["latency_seconds"] - before["latency_seconds"]
+    delta["latency_seconds"] = round(latency, 3)
+    delta["avg_latency_ms"] = round(1000 * latency / delta["requests"], 1) if delta["requests"] else 0
+    return delta
+
+
+class CountingReader:
+    """File-like wrapper of a response body that counts the decoded bytes read"""
+
+    def __init__(self, raw: Any):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+class _PooledClient(requests.Client):
+    """dlt's per-thread session client, with the sessions of all threads sharing one blocking connection pool.
+    dlt's retries are disabled, failed requests are retried by the callers' `RetryPolicy`."""
+
+    def __init__(self, adapter: HTTPAdapter, **kwargs: Any):
+        super().__init__(request_max_attempts=1, status_codes=(), exceptions=(), **kwargs)
+        self._pooled_adapter = adapter
+
+    def _make_session(self) -> requests.Session:
+        session = super()._make_session()
+        session.mount("https://", self._pooled_adapter)
+        session.mount("http://", self._pooled_adapter)
+        session.headers.update({"Accept-Encoding": "gzip"})
+        return session
+
+    def close(self) -> None:
+        self._pooled_adapter.close()
+
+
+class GitHubHttpClient:
+    """Thread-safe pooled client with keep-alive and gzip, shared by all pages and resources of a pipeline run.
+
+    `pool_size` is the number of per-host pools kept and `max_connections_per_host` the connections kept alive
+    to each host; threads beyond that wait for a free connection instead of opening new ones. Requests are
+    sent once, error status codes raise and retries are left to `RetryPolicy`.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = HTTP_POOL_SIZE,
+        max_connections_per_host: int = HTTP_MAX_CONNECTIONS_PER_HOST,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = HTTP_READ_TIMEOUT,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.stats = HttpStats()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=max_connections_per_host, pool_block=True)
+        # dlt's sessions raise for error status codes, which the retry logic relies on
+        self.client = _PooledClient(adapter, request_timeout=self.timeout, raise_for_status=True)
+
+    @property
+    def session(self) -> requests.Session:
+        """The session of the calling thread"""
+        return self.client.session
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        started = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except Exception as e:
+            response = getattr(e, "response", None)
+            self._record(started, response, error=True)
+            raise
+        self._record(started, response)
+        return response
+
+    @contextmanager
+    def stream(self, method: str, url: str, **kwargs: Any) -> Iterator["CountingReader"]:
+        """Sends the request and yields a file-like reader of the decoded body, for incremental parsing"""
+        kwargs.setdefault("timeout", self.timeout)
+        started = time.monotonic()
+        try:
+            response = self.session.request(method, url, stream=True, **kwargs)
+        except Exception as e:
+            self._record(started, getattr(e, "response", None), error=True)
+            raise
+        response.raw.decode_content = True
+        reader = CountingReader(response.raw)
+        error = False
+        try:
+            yield reader
+        except Exception:
+            error = True
+            raise
+        finally:
+            try:
+                on_wire = response.raw.tell() or reader.bytes_read
+            except Exception:
+                on_wire = reader.bytes_read
+            self.stats.record(time.monotonic() - started, reader.bytes_read, on_wire, error)
+            response.close()
+
+    def _record(self, started: float, response: Optional[requests.Response], error: bool = False) -> None:
+        received = on_wire = 0
+        if response is not None:
+            received = len(response.content)
+            try:
+                # bytes read from the socket, i.e. before gzip decoding
+                on_wire = response.raw.tell() or received
+            except Exception:
+                on_wire = received
+        self.stats.record(time.monotonic() - started, received, on_wire, error)
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def close(self) -> None:
+        self.client.close()
+
+
+class AsyncGitHubHttpClient:
+    """asyncio variant of `GitHubHttpClient`, requires the optional `httpx` package"""
+
+    def __init__(
+        self,
+        pool_size: int = HTTP_POOL_SIZE,
+        max_connections_per_host: int = HTTP_MAX_CONNECTIONS_PER_HOST,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = HTTP_READ_TIMEOUT,
+    ):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("AsyncGitHubHttpClient requires httpx, install it with `pip install httpx`")
+
+        self.stats = HttpStats()
+        # GitHub APIs are served from a single host, so the total limit is the per-host limit
+        self.client = httpx.AsyncClient(
+            headers={"Accept-Encoding": "gzip"},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections_per_host,
+                max_keepalive_connections=min(pool_size, max_connections_per_host) or None,
+            ),
+        )
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> Any:
+        started = time.monotonic()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            response.raise_for_status()
+        except Exception:
+            self.stats.record(time.monotonic() - started, 0, 0, error=True)
+            raise
+        self.stats.record(time.monotonic() - started, len(response.content), response.num_bytes_downloaded)
+        return response
+
+    async def get(self, url: str, **kwargs: Any) -> Any:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> Any:
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+_client: Optional[GitHubHttpClient] = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> GitHubHttpClient:
+    """The process wide client, created on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GitHubHttpClient()
+        return _client
@@ -0,0 +1,75 @@
+"""GraphQL selection sets built from the columns the semantic layer reads.
+
+The lean ingestion profile only fetches the fields behind `sql_to_underlying_datasource` and the
+dimensions of the metrics, plus the fields the pipeline itself needs (keys, ordering and incremental cursors).
+"""
+
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, Set
+
+from .settings import SEMANTIC_LAYER_PATH
+
+# fields the loaders rely on, whatever the metrics read
+REQUIRED_FIELDS: Dict[str, Set[str]] = {
+    "issues": {"number", "created_at", "updated_at"},
+    "pull_requests": {"number", "created_at", "updated_at"},
+    "commits": {"oid", "committed_date"},
+    "stargazers": {"user__login"},
+}
+
+# `stargazers` rows are built from edges, the user is the `node` of the edge
+_RENAMES: Dict[str, Dict[str, str]] = {
+    "stargazers": {"user": "node"},
+}
+
+_FROM_TABLE = re.compile(r"^\s*SELECT\s+(?P<columns>.+?)\s+FROM\s+\w+\.(?P<table>\w+)\s*$", re.IGNORECASE | re.DOTALL)
+
+
+def _camel(name: str) -> str:
+    head, *tail = name.split("_")
+    return head + "".join(part.capitalize() for part in tail)
+
+
+@lru_cache(maxsize=None)
+def semantic_layer_columns(path: str = SEMANTIC_LAYER_PATH) -> Dict[str, frozenset]:
+    """Columns read per destination table by the metrics in the semantic layer folder"""
+    columns: Dict[str, Set[str]] = {}
+    for file_name in os.listdir(path):
+        if not file_name.endswith(".json") or file_name == "examples.json":
+            continue
+        with open(os.path.join(path, file_name)) as f:
+            metric = json.load(f)
+        match = _FROM_TABLE.match(metric.get("sql_to_underlying_datasource", ""))
+        if not match:
+            print(f"Cannot project {file_name}, its SQL is not a plain SELECT of one table")
+            continue
+        table_columns = columns.setdefault(match.group("table"), set())
+        table_columns.update(column.strip().lower() for column in match.group("columns").split(","))
+        table_columns.update(dimension["name"] for dimension in metric.get("dimensions", []))
+    return {table: frozenset(table_columns) for table, table_columns in columns.items()}
+
+
+def selection_set(columns: Iterable[str], renames: Dict[str, str] | None = None) -> str:
+    """Turns dlt column names into a GraphQL selection set, e.g. `author__user__login` into `author { user { login } }`"""
+    tree: Dict[str, dict] = {}
+    for column in sorted(columns):
+        node = tree
+        for depth, part in enumerate(column.split("__")):
+            if depth == 0 and renames and part in renames:
+                part = renames[part]
+            node = node.setdefault(_camel(part), {})
+
+    def render(node: Dict[str, dict]) -> str:
+        return " ".join(f"{field} {{ {render(children)} }}" if children else field for field, children in node.items())
+
+    return render(tree)
+
+
+@lru_cache(maxsize=None)
+def lean_fields(table: str, path: str = SEMANTIC_LAYER_PATH) -> str:
+    """Selection set of one item of `table` in the lean profile"""
+    columns = set(semantic_layer_columns(path).get(table, ())) | REQUIRED_FIELDS.get(table, set())
+    return selection_set(columns, _RENAMES.get(table))
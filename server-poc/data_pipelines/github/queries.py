@@ -10,7 +10,7 @@ RATE_LIMIT = """
 ISSUES_QUERY = """
 query($owner: String!, $name: String!, $issues_per_page: Int!,   $first_comments: Int!, $page_after: String) {
   repository(owner: $owner, name: $name) {
-    %s(first: $issues_per_page, orderBy: {field: CREATED_AT, direction: DESC}, after: $page_after) {
+    %s(first: $issues_per_page, orderBy: {field: %s, direction: DESC}, after: $page_after) {
       totalCount
       pageInfo {
         endCursor
@@ -40,6 +40,10 @@ query($owner: String!, $name: String!, $issues_per_page: Int!,   $first_comments
         # }
         comments(first: $first_comments) {
           totalCount
+          pageInfo {
+            endCursor
+            hasNextPage
+          }
           nodes {
             id
             url
@@ -71,6 +75,31 @@ query($owner: String!, $name: String!, $issues_per_page: Int!,   $first_comments
 }
 """
 
+# follow-up page of comments for one issue or pull request, aliased so several items fit in a query.
+# the comment fields must match the ones in ISSUES_QUERY
+MORE_COMMENTS_QUERY = """
+item_%s: repository(owner: $owner, name: $name) {
+    %s(number: %s) {
+      number
+      comments(first: 100, after: %s) {
+        pageInfo {
+          endCursor
+          hasNextPage
+        }
+        nodes {
+          id
+          url
+          body
+          author {avatarUrl login url}
+          authorAssociation
+          createdAt
+          reactionGroups {content createdAt}
+        }
+      }
+    }
+  }
+"""
+
 COMMENT_REACTIONS_QUERY = """
 node_%s: node(id:"%s") {
      ... on IssueComment {
@@ -115,11 +144,11 @@ query($owner: String!, $name: String!, $items_per_page: Int!, $page_after: Strin
 """
 
 COMMITS_QUERY = """
-query($owner: String!, $name: String!, $items_per_page: Int!, $page_after: String) {
+query($owner: String!, $name: String!, $items_per_page: Int!, $page_after: String, $since: GitTimestamp, $until: GitTimestamp) {
   repository(owner: $owner, name: $name) {
     object(expression: "HEAD") {
       ... on Commit {
-        history(first: $items_per_page, after: $page_after) {
+        history(first: $items_per_page, after: $page_after, since: $since, until: $until) {
           pageInfo {
             endCursor
             startCursor
@@ -163,3 +192,96 @@ query($owner: String!, $name: String!, $items_per_page: Int!, $page_after: Strin
   }
 }
 """
+
+COMMITS_WINDOW_COUNT_QUERY = """
+query($owner: String!, $name: String!, $since: GitTimestamp, $until: GitTimestamp) {
+  repository(owner: $owner, name: $name) {
+    createdAt
+    object(expression: "HEAD") {
+      ... on Commit {
+        history(since: $since, until: $until) {
+          totalCount
+        }
+      }
+    }
+  }
+  rateLimit {
+    limit
+    cost
+    remaining
+    resetAt
+  }
+}
+"""
+
+# lean profile: the selection sets of the items are built from the semantic layer, see projection.py
+ISSUES_LEAN_QUERY = """
+query($owner: String!, $name: String!, $issues_per_page: Int!, $page_after: String) {
+  repository(owner: $owner, name: $name) {
+    %s(first: $issues_per_page, orderBy: {field: %s, direction: DESC}, after: $page_after) {
+      totalCount
+      pageInfo {
+        endCursor
+        startCursor
+      }
+      nodes {
+        %s
+      }
+    }
+  }
+  rateLimit {
+    limit
+    cost
+    remaining
+    resetAt
+  }
+}
+"""
+
+STARGAZERS_LEAN_QUERY = """
+query($owner: String!, $name: String!, $items_per_page: Int!, $page_after: String) {
+  repository(owner: $owner, name: $name) {
+    stargazers(first: $items_per_page, orderBy: {field: STARRED_AT, direction: DESC}, after: $page_after) {
+      pageInfo {
+        endCursor
+        startCursor
+      }
+      edges {
+        %s
+      }
+    }
+  }
+  rateLimit {
+    limit
+    cost
+    remaining
+    resetAt
+  }
+}
+"""
+
+COMMITS_LEAN_QUERY = """
+query($owner: String!, $name: String!, $items_per_page: Int!, $page_after: String, $since: GitTimestamp, $until: GitTimestamp) {
+  repository(owner: $owner, name: $name) {
+    object(expression: "HEAD") {
+      ... on Commit {
+        history(first: $items_per_page, after: $page_after, since: $since, until: $until) {
+          pageInfo {
+            endCursor
+            startCursor
+          }
+          nodes {
+            %s
+          }
+        }
+      }
+    }
+  }
+  rateLimit {
+    limit
+    cost
+    remaining
+    resetAt
+  }
+}
+"""
@@ -0,0 +1,285 @@
+"""Budgets and rate limit scheduling shared by all GraphQL requests made with the same access token."""
+
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Deque, Dict, Iterator, Optional
+
+from dlt.common import pendulum
+
+from .settings import (
+    GRAPHQL_MAX_CONCURRENT_REQUESTS,
+    GRAPHQL_MAX_REQUESTS_PER_MINUTE,
+    GRAPHQL_RESERVED_CREDITS,
+    GRAPHQL_TARGET_PAGE_COST,
+)
+
+
+# string and number literals, e.g. the ids, numbers and cursors of aliased follow-up queries
+_LITERALS = re.compile(r'"(?:[^"\\]|\\.)*"|\d+')
+
+
+def query_shape_key(query: str) -> int:
+    """Key of the query shape the cost is predicted for. Aliased batch queries differ only by literals,
+    so the keys stay bounded by the number of queries and batch sizes."""
+    return hash(_LITERALS.sub("", query))
+
+
+class RateLimitStore:
+    """Shares the limits of a token between processes. The default keeps everything in the process,
+    pipeline workers install a store backed by the database (see `server_poc.token_usage`)."""
+
+    def slot(self, access_token: Optional[str], max_concurrent: int) -> ContextManager[None]:
+        """Held while a request of the token is in flight, at most `max_concurrent` over all processes"""
+        return nullcontext()
+
+    def load(self, access_token: Optional[str]) -> Optional[Dict[str, Optional[float]]]:
+        """The lowest `limit`, `remaining` and `reset_at` reported to any process in the current window"""
+        return None
+
+    def save(self, access_token: Optional[str], limit: Optional[int], remaining: int, reset_at: Optional[float]) -> None:
+        pass
+
+
+class GraphQLBudget:
+    """Keeps concurrent fetches for one token under GitHub's secondary rate limits.
+
+    Limits the number of requests in flight and the number started in any 60 second window,
+    and accounts the query cost reported in the `rateLimit` block. Requests in flight are also
+    limited over all processes through the `store`, the per-minute budget is split between `processes`.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_per_minute: int,
+        access_token: Optional[str] = None,
+        store: Optional[RateLimitStore] = None,
+        processes: int = 1,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_per_minute = max(1, max_per_minute // processes)
+        self.access_token = access_token
+        self.store = store or RateLimitStore()
+        self.requests = 0
+        self.cost = 0
+        self.waited_seconds = 0.0
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._started: Deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def _wait_for_window(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._started and now - self._started[0] >= 60:
+                    self._started.popleft()
+                if len(self._started) < self.max_per_minute:
+                    self._started.append(now)
+                    self.requests += 1
+                    return
+                wait = 60 - (now - self._started[0])
+            self.waited_seconds += wait
+            time.sleep(wait)
+
+    @contextmanager
+    def request(self) -> Iterator[None]:
+        started = time.monotonic()
+        with self._slots, self.store.slot(self.access_token, self.max_concurrent):
+            self.waited_seconds += time.monotonic() - started
+            self._wait_for_window()
+            yield
+
+    def record(self, cost: Optional[int]) -> None:
+        with self._lock:
+            self.cost += cost or 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "cost": self.cost,
+                "waited_seconds": round(self.waited_seconds, 2),
+            }
+
+
+class RateLimitScheduler:
+    """Tracks the primary (hourly credit) rate limit of one token from the `rateLimit` block of every response.
+
+    Before a query is sent its cost is predicted from earlier runs of the same query and reserved. A query
+    that would take the remaining credits below `reserved_credits` sleeps until `resetAt`, while cheaper
+    queries can still go ahead, so expensive work is pushed back first.
+
+    The counts are shared with other processes through the `store`, read at most every `sync_seconds`.
+    """
+
+    def __init__(
+        self,
+        reserved_credits: int,
+        access_token: Optional[str] = None,
+        store: Optional[RateLimitStore] = None,
+        sync_seconds: float = 1.0,
+    ):
+        self.reserved_credits = reserved_credits
+        self.access_token = access_token
+        self.store = store or RateLimitStore()
+        self.sync_seconds = sync_seconds
+        self._synced_at = 0.0
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at: Optional[float] = None
+        self.sleeps = 0
+        self.slept_seconds = 0.0
+        self._predicted_cost: Dict[int, float] = {}
+        self._in_flight = 0.0
+        self._lock = threading.Lock()
+
+    def predict_cost(self, query_key: int) -> float:
+        return self._predicted_cost.get(query_key, 1.0)
+
+    def _wait_seconds(self, cost: float) -> float:
+        if self.remaining is None or self.reset_at is None:
+            return 0
+        now = time.time()
+        if now >= self.reset_at:
+            # the window rolled over, assume a full budget until the next response says otherwise
+            self.remaining = self.limit
+            self.reset_at = None
+            return 0
+        if self.remaining - self._in_flight - cost >= self.reserved_credits:
+            return 0
+        return self.reset_at - now + 1
+
+    def headroom(self, query_key: int) -> Optional[float]:
+        """Credits left after in-flight queries and this one, None while no response was seen yet."""
+        with self._lock:
+            cost = self.predict_cost(query_key)
+            if self._wait_seconds(cost) > 0:
+                return self.remaining - self._in_flight - cost - self.reserved_credits
+            if self.remaining is None:
+                return None
+            return self.remaining - self._in_flight - cost
+
+    def _sync(self) -> None:
+        """Takes over a lower count or a newer window another process has seen"""
+        if time.monotonic() - self._synced_at < self.sync_seconds:
+            return
+        self._synced_at = time.monotonic()
+        try:
+            shared = self.store.load(self.access_token)
+        except Exception as e:
+            print(f"Could not read the shared rate limit: {e}")
+            return
+        if not shared or shared.get("remaining") is None:
+            return
+        with self._lock:
+            reset_at = shared.get("reset_at")
+            if time.time() >= (reset_at or 0):
+                return
+            if self.reset_at is None or reset_at > self.reset_at or (reset_at == self.reset_at and shared["remaining"] < self.remaining):
+                self.remaining = int(shared["remaining"])
+                self.reset_at = reset_at
+                self.limit = int(shared.get("limit") or self.limit or 0) or None
+
+    def before(self, query_key: int) -> float:
+        """Blocks until the query fits in the remaining credits. Returns the reserved cost."""
+        while True:
+            self._sync()
+            with self._lock:
+                cost = self.predict_cost(query_key)
+                wait = self._wait_seconds(cost)
+                if wait <= 0:
+                    self._in_flight += cost
+                    return cost
+                self.sleeps += 1
+            print(f"Rate limit budget low ({self.remaining} credits left), waiting {wait:.0f}s for the reset")
+            self.slept_seconds += wait
+            time.sleep(wait)
+
+    def after(self, query_key: int, reserved: float, rate_limit: Optional[Dict[str, object]]) -> None:
+        with self._lock:
+            self._in_flight = max(0.0, self._in_flight - reserved)
+            if not rate_limit or rate_limit.get("remaining") is None:
+                return
+            cost = float(rate_limit.get("cost") or 0)
+            previous = self._predicted_cost.get(query_key)
+            # exponential moving average, so a few expensive pages move the prediction quickly
+            self._predicted_cost[query_key] = cost if previous is None else 0.5 * previous + 0.5 * cost
+
+            reset_at = pendulum.parse(rate_limit["resetAt"]).timestamp() if rate_limit.get("resetAt") else None
+            remaining = int(rate_limit["remaining"])
+            # responses of concurrent queries arrive out of order, keep the lowest count of the current window
+            if reset_at != self.reset_at or self.remaining is None or remaining < self.remaining:
+                self.remaining = remaining
+            self.limit = int(rate_limit.get("limit") or self.limit or 0) or None
+            self.reset_at = reset_at
+        try:
+            self.store.save(self.access_token, self.limit, remaining, reset_at)
+        except Exception as e:
+            print(f"Could not share the rate limit: {e}")
+
+    def release(self, reserved: float) -> None:
+        with self._lock:
+            self._in_flight = max(0.0, self._in_flight - reserved)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "remaining": self.remaining,
+                "reset_at": self.reset_at,
+                "sleeps": self.sleeps,
+                "slept_seconds": round(self.slept_seconds, 1),
+            }
+
+
+def adapt_page_size(page_size: int, cost: Optional[float], min_size: int, max_size: int, target_cost: float = GRAPHQL_TARGET_PAGE_COST) -> int:
+    """Scales the page size so a page costs about `target_cost` credits: smaller for expensive
+    queries (e.g. issues with 100 comments each) and back up when they are cheap."""
+    if not cost:
+        return page_size
+    if cost > target_cost:
+        return max(min_size, int(page_size * target_cost / cost))
+    if cost <= target_cost / 2:
+        return min(max_size, page_size * 2)
+    return page_size
+
+
+_budgets: Dict[Optional[str], GraphQLBudget] = {}
+_schedulers: Dict[Optional[str], RateLimitScheduler] = {}
+_budgets_lock = threading.Lock()
+_store: Optional[RateLimitStore] = None
+_processes = 1
+
+
+def share_limits(store: RateLimitStore, processes: int) -> None:
+    """Shares the limits of every token with the other `processes` processes loading data through `store`.
+    Call before the first request, budgets created before are dropped."""
+    global _store, _processes
+    with _budgets_lock:
+        _store = store
+        _processes = max(1, processes)
+        _budgets.clear()
+        _schedulers.clear()
+
+
+def get_budget(access_token: Optional[str]) -> GraphQLBudget:
+    with _budgets_lock:
+        budget = _budgets.get(access_token)
+        if budget is None:
+            budget = GraphQLBudget(
+                GRAPHQL_MAX_CONCURRENT_REQUESTS, GRAPHQL_MAX_REQUESTS_PER_MINUTE, access_token, _store, _processes
+            )
+            _budgets[access_token] = budget
+        return budget
+
+
+def get_scheduler(access_token: Optional[str]) -> RateLimitScheduler:
+    with _budgets_lock:
+        scheduler = _schedulers.get(access_token)
+        if scheduler is None:
+            scheduler = RateLimitScheduler(GRAPHQL_RESERVED_CREDITS, access_token, _store)
+            _schedulers[access_token] = scheduler
+        return scheduler
@@ -0,0 +1,170 @@
+"""Retry policy for GitHub GraphQL and REST requests."""
+
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from requests.exceptions import ChunkedEncodingError, ConnectionError, Timeout
+
+from .settings import (
+    RETRY_BASE_DELAY,
+    RETRY_BUDGET_MIN,
+    RETRY_BUDGET_RATIO,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_MAX_DELAY,
+)
+
+# status codes GitHub returns for queries that timed out or failed upstream, usually expensive pages
+TIMEOUT_STATUS_CODES = {502, 504}
+TRANSIENT_STATUS_CODES = {500, 502, 503, 504}
+
+
+class RetryBudgetExhausted(Exception):
+    pass
+
+
+class RetryDecision:
+    """What to do about a failed request: wait `delay` seconds, optionally with a smaller page"""
+
+    def __init__(self, reason: str, delay: float, shrink_page: bool = False):
+        self.reason = reason
+        self.delay = delay
+        self.shrink_page = shrink_page
+
+
+class RetryStats:
+    """Retries and time spent waiting for them, by reason"""
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.gave_up = 0
+        self.wasted_seconds = 0.0
+        self.reasons: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "gave_up": self.gave_up,
+                "wasted_seconds": round(self.wasted_seconds, 2),
+                "reasons": dict(self.reasons),
+            }
+
+
+def retry_stats_delta(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """Retries made between two snapshots"""
+    return {
+        "requests": after["requests"] - before["requests"],
+        "retries": after["retries"] - before["retries"],
+        "gave_up": after["gave_up"] - before["gave_up"],
+        "wasted_seconds": round(after["wasted_seconds"] - before["wasted_seconds"], 2),
+        "reasons": {
+            reason: count - before["reasons"].get(reason, 0)
+            for reason, count in after["reasons"].items()
+            if count - before["reasons"].get(reason, 0)
+        },
+    }
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded per request by `max_attempts`.
+
+    Rate limit responses wait for `Retry-After` or `x-ratelimit-reset` instead of backing off. Retries of
+    all requests in the process share a budget of `budget_min + budget_ratio * requests`, so an outage
+    fails the loads quickly instead of multiplying the traffic.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        base_delay: float = RETRY_BASE_DELAY,
+        max_delay: float = RETRY_MAX_DELAY,
+        budget_ratio: float = RETRY_BUDGET_RATIO,
+        budget_min: int = RETRY_BUDGET_MIN,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_min = budget_min
+        self.stats = RetryStats()
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def classify(self, error: Optional[Exception], errors: Optional[list], attempt: int) -> Optional[RetryDecision]:
+        """Returns how to retry a failed request, None when it should not be retried.
+        `error` is the exception of the request, `errors` the `errors` of a GraphQL response."""
+        if errors is not None:
+            if any(e.get("type") == "RATE_LIMITED" for e in errors):
+                return RetryDecision("graphql_rate_limited", self.backoff(attempt))
+            # GitHub reports some query timeouts as GraphQL errors with a 200 status
+            if any("timeout" in str(e.get("message", "")).lower() for e in errors):
+                return RetryDecision("graphql_timeout", self.backoff(attempt), shrink_page=True)
+            return None
+
+        response = getattr(error, "response", None)
+        if response is None:
+            if isinstance(error, Timeout):
+                return RetryDecision("timeout", self.backoff(attempt), shrink_page=True)
+            if isinstance(error, (ConnectionError, ChunkedEncodingError)):
+                return RetryDecision("network", self.backoff(attempt))
+            return None
+
+        status = response.status_code
+        headers = response.headers
+        if status in (403, 429):
+            if "Retry-After" in headers:
+                return RetryDecision("secondary_rate_limit", float(headers["Retry-After"]))
+            if headers.get("x-ratelimit-remaining") == "0" and "x-ratelimit-reset" in headers:
+                return RetryDecision("rate_limit", max(0.0, float(headers["x-ratelimit-reset"]) - time.time()) + 1)
+            if status == 429:
+                return RetryDecision("secondary_rate_limit", self.backoff(attempt))
+            return None
+        if status in TRANSIENT_STATUS_CODES:
+            return RetryDecision(f"http_{status}", self.backoff(attempt), shrink_page=status in TIMEOUT_STATUS_CODES)
+        return None
+
+    def _take_budget(self) -> bool:
+        with self.stats._lock:
+            if self.stats.retries >= self.budget_min + self.budget_ratio * self.stats.requests:
+                self.stats.gave_up += 1
+                return False
+            self.stats.retries += 1
+            return True
+
+    def record_request(self) -> None:
+        with self.stats._lock:
+            self.stats.requests += 1
+
+    def wait(self, decision: RetryDecision, attempt: int, failed_seconds: float = 0.0) -> None:
+        """Sleeps before the next attempt, raises when out of attempts or out of the retry budget.
+        `failed_seconds` is the time spent on the failed request, counted as wasted."""
+        if attempt + 1 >= self.max_attempts:
+            with self.stats._lock:
+                self.stats.gave_up += 1
+            raise RetryBudgetExhausted(f"Giving up after {attempt + 1} attempts ({decision.reason})")
+        if not self._take_budget():
+            raise RetryBudgetExhausted(f"Retry budget exhausted ({decision.reason})")
+        print(f"GitHub request failed ({decision.reason}), retrying in {decision.delay:.1f}s (attempt {attempt + 2}/{self.max_attempts})")
+        with self.stats._lock:
+            self.stats.reasons[decision.reason] = self.stats.reasons.get(decision.reason, 0) + 1
+            self.stats.wasted_seconds += decision.delay + failed_seconds
+        time.sleep(decision.delay)
+
+
+_policy: Optional[RetryPolicy] = None
+_policy_lock = threading.Lock()
+
+
+def get_retry_policy() -> RetryPolicy:
+    """The process wide policy, created on first use"""
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = RetryPolicy()
+        return _policy
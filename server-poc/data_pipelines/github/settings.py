@@ -1,5 +1,7 @@
 """Github source settings and constants."""
 
+import os
+
 START_DATE = "1970-01-01T00:00:00Z"
 
 # rest queries
@@ -8,3 +10,69 @@ REPO_EVENTS_PATH = "/repos/%s/%s/events"
 
 # graphql queries
 GRAPHQL_API_BASE_URL = "https://api.github.com/graphql"
+
+# secondary rate limits shared by concurrent fetches using the same token
+GRAPHQL_MAX_CONCURRENT_REQUESTS = int(os.environ.get("GITHUB_GRAPHQL_MAX_CONCURRENT_REQUESTS", 4))
+GRAPHQL_MAX_REQUESTS_PER_MINUTE = int(os.environ.get("GITHUB_GRAPHQL_MAX_REQUESTS_PER_MINUTE", 900))
+
+# partitioned commit history fetching
+COMMITS_MAX_PARTITION_SIZE = int(os.environ.get("GITHUB_COMMITS_MAX_PARTITION_SIZE", 5000))
+COMMITS_PARTITION_WORKERS = int(os.environ.get("GITHUB_COMMITS_PARTITION_WORKERS", 4))
+
+# shared HTTP client
+HTTP_POOL_SIZE = int(os.environ.get("GITHUB_HTTP_POOL_SIZE", 4))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("GITHUB_HTTP_MAX_CONNECTIONS_PER_HOST", 16))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("GITHUB_HTTP_CONNECT_TIMEOUT", 10))
+HTTP_READ_TIMEOUT = float(os.environ.get("GITHUB_HTTP_READ_TIMEOUT", 60))
+
+# primary rate limit scheduling
+GRAPHQL_RESERVED_CREDITS = int(os.environ.get("GITHUB_GRAPHQL_RESERVED_CREDITS", 50))
+GRAPHQL_TARGET_PAGE_COST = float(os.environ.get("GITHUB_GRAPHQL_TARGET_PAGE_COST", 10))
+GRAPHQL_MIN_PAGE_SIZE = int(os.environ.get("GITHUB_GRAPHQL_MIN_PAGE_SIZE", 10))
+# the most items GitHub returns for one connection page
+GRAPHQL_MAX_PAGE_SIZE = 100
+
+# extra tokens GraphQL requests are spread over, comma separated
+GITHUB_TOKEN_POOL = [t.strip() for t in os.environ.get("GITHUB_TOKEN_POOL", "").split(",") if t.strip()]
+
+# full loads are committed every this many pages so a failed run can resume, 0 loads everything in one run
+CHECKPOINT_PAGES = int(os.environ.get("PIPELINE_CHECKPOINT_PAGES", 20))
+
+# retries of failed GraphQL requests, the budget caps retries at RETRY_BUDGET_MIN + RETRY_BUDGET_RATIO * requests
+RETRY_MAX_ATTEMPTS = int(os.environ.get("GITHUB_RETRY_MAX_ATTEMPTS", 6))
+RETRY_BASE_DELAY = float(os.environ.get("GITHUB_RETRY_BASE_DELAY", 1))
+RETRY_MAX_DELAY = float(os.environ.get("GITHUB_RETRY_MAX_DELAY", 60))
+RETRY_BUDGET_RATIO = float(os.environ.get("GITHUB_RETRY_BUDGET_RATIO", 0.2))
+RETRY_BUDGET_MIN = int(os.environ.get("GITHUB_RETRY_BUDGET_MIN", 20))
+
+# comment reaction enrichment, the batch size adapts to the query cost
+REACTIONS_BATCH_SIZE = int(os.environ.get("GITHUB_REACTIONS_BATCH_SIZE", 50))
+REACTIONS_WORKERS = int(os.environ.get("GITHUB_REACTIONS_WORKERS", 2))
+
+# comments fetched with every issue/PR, longer threads are completed by batched follow-up queries
+FIRST_COMMENTS = int(os.environ.get("GITHUB_FIRST_COMMENTS", 20))
+COMMENTS_BATCH_SIZE = int(os.environ.get("GITHUB_COMMENTS_BATCH_SIZE", 10))
+
+# `lean` fetches only the fields the semantic layer reads, `full` also bodies, commit messages and comments
+INGESTION_PROFILE = os.environ.get("PIPELINE_INGESTION_PROFILE", "lean")
+# reactions of issue/PR comments are loaded after the primary load, issues and PRs then use the `full` profile
+ENRICH_REACTIONS = os.environ.get("PIPELINE_ENRICH_REACTIONS", "0") != "0"
+SEMANTIC_LAYER_PATH = os.environ.get("SEMANTIC_LAYER_PATH", "semantic_layer")
+
+# parse GraphQL responses while they are read (needs ijson) and pass nodes on in chunks of this size
+STREAM_RESPONSES = os.environ.get("GITHUB_STREAM_RESPONSES", "1") != "0"
+STREAM_CHUNK_ITEMS = int(os.environ.get("GITHUB_STREAM_CHUNK_ITEMS", 10))
+# response bodies are spooled to a temporary file before parsing, kept in memory up to this size
+STREAM_SPOOL_MAX_BYTES = int(os.environ.get("GITHUB_STREAM_SPOOL_MAX_BYTES", 1024 * 1024))
+
+# `bulk` tunes dlt for throughput: parallel normalize, rotated files and COPY loading, see github_pipeline.py
+LOAD_PROFILE = os.environ.get("PIPELINE_LOAD_PROFILE", "default")
+BULK_NORMALIZE_WORKERS = int(os.environ.get("PIPELINE_NORMALIZE_WORKERS") or os.cpu_count() or 1)
+BULK_BUFFER_MAX_ITEMS = int(os.environ.get("PIPELINE_BUFFER_MAX_ITEMS", 50000))
+BULK_FILE_MAX_ITEMS = int(os.environ.get("PIPELINE_FILE_MAX_ITEMS", 200000))
+BULK_LOAD_WORKERS = int(os.environ.get("PIPELINE_DLT_LOAD_WORKERS", 8))
+BULK_LOADER_FILE_FORMAT = os.environ.get("PIPELINE_LOADER_FILE_FORMAT", "csv")
+
+# full loads go to a `{dataset}_next` schema that is swapped in once complete, previous versions are kept for rollback
+SWAP_SCHEMAS = os.environ.get("PIPELINE_SWAP_SCHEMAS", "1") != "0"
+KEEP_DATASET_VERSIONS = int(os.environ.get("PIPELINE_KEEP_DATASET_VERSIONS", 1))
@@ -0,0 +1,67 @@
+"""Incremental parsing of GraphQL responses, requires the optional `ijson` package.
+
+Nodes of the paginated connection are built one at a time while the body is read from the socket,
+so a page is never held in memory as a whole, neither as text nor as nested dicts.
+"""
+
+from typing import Any, BinaryIO, Dict, Iterator, Tuple
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+def streaming_available() -> bool:
+    return ijson is not None
+
+
+def connection_prefix(node_type: str) -> str:
+    """ijson prefix of the top connection, e.g. `data.repository.object.history` for `object/history`"""
+    return "data.repository." + ".".join(node_type.split("/"))
+
+
+def parse_graphql_stream(body: BinaryIO, node_type: str) -> Iterator[Tuple[str, Any]]:
+    """Yields `("node", node)` for every node or edge of the `node_type` connection as soon as it is parsed,
+    and `("page_info", ...)`, `("rate_limit", ...)`, `("errors", ...)` and `("data", None)` when present.
+    Values arrive in the order of the response, i.e. the order of the fields in the query."""
+    if ijson is None:
+        raise ImportError("Streaming GraphQL responses requires ijson, install it with `pip install ijson`")
+
+    connection = connection_prefix(node_type)
+    wanted: Dict[str, str] = {
+        f"{connection}.nodes.item": "node",
+        f"{connection}.edges.item": "node",
+        f"{connection}.pageInfo": "page_info",
+        "data.rateLimit": "rate_limit",
+        "errors": "errors",
+        "data": "data",
+    }
+
+    builder = None
+    kind = None
+    depth = 0
+    for prefix, event, value in ijson.parse(body, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if event in ("start_map", "start_array"):
+                depth += 1
+            elif event in ("end_map", "end_array"):
+                depth -= 1
+                if depth == 0:
+                    yield kind, builder.value
+                    builder = None
+            continue
+
+        kind = wanted.get(prefix)
+        if kind is None:
+            continue
+        if event in ("start_map", "start_array"):
+            # `data` itself is only reported when it is null, its content is walked through
+            if kind == "data":
+                continue
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            depth = 1
+        elif event not in ("map_key", "end_map", "end_array"):
+            yield kind, value
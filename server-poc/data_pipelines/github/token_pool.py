@@ -0,0 +1,86 @@
+"""Pool of GitHub tokens that GraphQL requests are spread over."""
+
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from .rate_limit import get_scheduler
+from .settings import GITHUB_TOKEN_POOL
+
+
+class NoTokenAvailable(Exception):
+    pass
+
+
+class TokenPool:
+    """Picks the token with the most remaining GraphQL credits for every request.
+
+    Remaining credits come from the `rateLimit` block tracked by each token's `RateLimitScheduler`.
+    Tokens that were never used are preferred, so every token reports its budget early. Revoked
+    tokens (401) are dropped from the pool until they are registered again. Requests a pooled token
+    can't make for lack of access to the repository are sent with the run's own token instead.
+    """
+
+    def __init__(self, tokens: Iterable[str] = ()):
+        self._tokens: List[str] = list(dict.fromkeys(t for t in tokens if t))
+        self._revoked: Set[str] = set()
+        self._requests: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def set_tokens(self, tokens: Iterable[str]) -> None:
+        with self._lock:
+            self._tokens = list(dict.fromkeys(t for t in tokens if t))
+            self._revoked &= set(self._tokens)
+
+    def add(self, token: str) -> None:
+        with self._lock:
+            if token not in self._tokens:
+                self._tokens.append(token)
+            self._revoked.discard(token)
+
+    def revoke(self, token: str) -> None:
+        with self._lock:
+            self._revoked.add(token)
+        print(f"GitHub token ...{token[-4:]} was rejected, removing it from the pool")
+
+    @property
+    def revoked(self) -> Set[str]:
+        with self._lock:
+            return set(self._revoked)
+
+    def choose(self, query_key: int, access_token: Optional[str] = None) -> str:
+        """Returns the pooled token (or the caller's own `access_token`) with the largest headroom for the query.
+        When every token is low on credits the one with the largest headroom is returned and its scheduler waits.
+        """
+        with self._lock:
+            candidates = [t for t in dict.fromkeys([*self._tokens, access_token]) if t and t not in self._revoked]
+        if not candidates:
+            raise NoTokenAvailable("All GitHub tokens in the pool were revoked")
+
+        def rank(token: str) -> float:
+            headroom = get_scheduler(token).headroom(query_key)
+            return float("inf") if headroom is None else headroom
+
+        token = max(candidates, key=rank)
+        with self._lock:
+            self._requests[token] = self._requests.get(token, 0) + 1
+        return token
+
+    def stats(self) -> List[Dict[str, object]]:
+        with self._lock:
+            tokens = list(dict.fromkeys([*self._tokens, *self._requests]))
+            return [
+                {
+                    "token": f"...{token[-4:]}",
+                    "revoked": token in self._revoked,
+                    "requests": self._requests.get(token, 0),
+                    **get_scheduler(token).stats(),
+                }
+                for token in tokens
+            ]
+
+
+_pool = TokenPool(GITHUB_TOKEN_POOL)
+
+
+def get_token_pool() -> TokenPool:
+    return _pool
@@ -1,8 +1,199 @@
 import dlt
-from .github import github_reactions, github_stargazers, github_commits
+import os
+from datetime import datetime, timezone
+from typing import Callable, Optional
+from dlt.sources import DltSource
+from .github import github_reactions, github_stargazers, github_commits, github_comment_reactions
+from .github.settings import (
+    BULK_BUFFER_MAX_ITEMS,
+    BULK_FILE_MAX_ITEMS,
+    BULK_LOAD_WORKERS,
+    BULK_LOADER_FILE_FORMAT,
+    BULK_NORMALIZE_WORKERS,
+    CHECKPOINT_PAGES,
+    KEEP_DATASET_VERSIONS,
+    LOAD_PROFILE,
+    SWAP_SCHEMAS,
+)
 
-def load_issues_data(owner: str, repo: str, destination: str, access_token: str | None = None) -> None:
-    """Loads all issues and their reactions for the specified repo"""
+
+def load_profile_env(profile: str) -> dict[str, str]:
+    """dlt settings of a load profile as environment variables. `bulk` normalizes rotated files in
+    parallel processes and loads them with Postgres COPY, `default` keeps the dlt defaults."""
+    if profile != "bulk":
+        return {}
+    return {
+        "NORMALIZE__WORKERS": str(BULK_NORMALIZE_WORKERS),
+        # loads run in threads, forking them is not safe
+        "NORMALIZE__START_METHOD": "spawn",
+        "DATA_WRITER__BUFFER_MAX_ITEMS": str(BULK_BUFFER_MAX_ITEMS),
+        # rotated files are what the normalize workers split between them
+        "DATA_WRITER__FILE_MAX_ITEMS": str(BULK_FILE_MAX_ITEMS),
+        "LOAD__WORKERS": str(BULK_LOAD_WORKERS),
+    }
+
+
+def load_run_options(profile: str) -> dict:
+    """`pipeline.run` arguments of a load profile"""
+    if profile != "bulk":
+        return {}
+    return {"loader_file_format": BULK_LOADER_FILE_FORMAT}
+
+
+# explicit dlt configuration in the environment wins over the profile
+for _key, _value in load_profile_env(LOAD_PROFILE).items():
+    os.environ.setdefault(_key, _value)
+LOAD_OPTIONS = load_run_options(LOAD_PROFILE)
+
+
+def _high_water_mark(pipeline: dlt.Pipeline, table: str, column: str) -> Optional[str]:
+    """Latest value of `column` already in the destination table, None if the table doesn't exist yet"""
+    try:
+        with pipeline.sql_client() as client:
+            rows = client.execute_sql(f"SELECT MAX({column}) FROM {client.make_qualified_table_name(table)}")
+    except Exception as e:
+        print(f"No high-water mark for {table}.{column}: {e}")
+        return None
+    value = rows[0][0] if rows else None
+    return value.isoformat() if value is not None else None
+
+def _checkpoint(pipeline: dlt.Pipeline, source_name: str, resource: str) -> Optional[dict]:
+    resources = pipeline.state.get("sources", {}).get(source_name, {}).get("resources", {})
+    return resources.get(resource, {}).get("checkpoint")
+
+
+def _run_checkpointed(pipeline: dlt.Pipeline, make_source: Callable[[], DltSource], resource: str, later_batches: str = "append", **run_kwargs):
+    """Runs a full load in batches of `CHECKPOINT_PAGES` pages, each committed with its pagination checkpoint.
+    The first batch replaces the table, later ones are loaded with the `later_batches` write disposition.
+    A load that failed part way resumes from its checkpoint."""
+    # the local pipeline folder may be gone after a restart, the state is also kept in the destination
+    pipeline.sync_destination()
+    source = make_source()
+    checkpoint = _checkpoint(pipeline, source.name, resource)
+    if checkpoint:
+        print(f"Resuming {resource} load after {checkpoint.get('items_count', 0)} items")
+    while True:
+        write_disposition = later_batches if checkpoint is not None else "replace"
+        load_info = pipeline.run(source, write_disposition=write_disposition, **run_kwargs, **LOAD_OPTIONS)
+        checkpoint = _checkpoint(pipeline, source.name, resource)
+        if checkpoint is None:
+            return load_info
+        print(f"Loaded {checkpoint.get('items_count', 0)} {resource} so far")
+        source = make_source()
+
+
+# full loads land in `{dataset}_next`. not `{dataset}_staging`, which dlt uses for merge staging tables
+NEXT_SUFFIX = "_next"
+# version of a live schema that was loaded before versions were recorded
+INITIAL_VERSION = "00000000000000"
+
+
+# tables other pipelines load into a dataset, by the dlt schema they belong to. they are moved into each
+# promoted version, as the full load doesn't recreate them
+CARRIED_TABLES = {"comment_reactions": "github_comment_reactions"}
+
+
+def _schema_exists(client, schema: str) -> bool:
+    return bool(client.execute_sql("SELECT 1 FROM information_schema.schemata WHERE schema_name = %s", schema))
+
+
+def _table_exists(client, schema: str, table: str) -> bool:
+    return bool(client.execute_sql(
+        "SELECT 1 FROM information_schema.tables WHERE table_schema = %s AND table_name = %s", schema, table
+    ))
+
+
+def _carry_tables(client, source: str, target: str) -> None:
+    """Moves the `CARRIED_TABLES` from the `source` to the `target` schema together with the dlt loads,
+    schema versions and pipeline state of their pipelines, so those resume incrementally"""
+    for table, schema_name in CARRIED_TABLES.items():
+        if not _table_exists(client, source, table) or _table_exists(client, target, table):
+            continue
+        print(f"Carrying {source}.{table} over to the new version")
+        client.execute_sql(f'ALTER TABLE "{source}"."{table}" SET SCHEMA "{target}"')
+        client.execute_sql(
+            f'INSERT INTO "{target}"."_dlt_pipeline_state" SELECT * FROM "{source}"."_dlt_pipeline_state" '
+            f'WHERE _dlt_load_id IN (SELECT load_id FROM "{source}"."_dlt_loads" WHERE schema_name = %s)', schema_name
+        )
+        for bookkeeping in ("_dlt_loads", "_dlt_version"):
+            client.execute_sql(
+                f'INSERT INTO "{target}"."{bookkeeping}" SELECT * FROM "{source}"."{bookkeeping}" WHERE schema_name = %s', schema_name
+            )
+
+
+def _staging_pipeline(live: dlt.Pipeline) -> dlt.Pipeline:
+    """Pipeline that loads into the next version of the live pipeline's dataset"""
+    staging_dataset = f"{live.dataset_name}{NEXT_SUFFIX}"
+    pipeline = dlt.pipeline(
+        f"{live.pipeline_name}{NEXT_SUFFIX}",
+        destination=live.destination,
+        dataset_name=staging_dataset
+    )
+    with pipeline.sql_client() as client:
+        exists = _schema_exists(client, staging_dataset)
+    if not exists:
+        # nothing to resume, don't carry over the local state of a load that was already promoted
+        pipeline = pipeline.drop()
+    return pipeline
+
+
+def _promote(staging: dlt.Pipeline, dataset: str) -> str:
+    """Swaps the loaded `{dataset}_next` schema in for `dataset` in one transaction and returns the new version.
+    Queries running against the previous version finish on it, it is kept as `{dataset}__v{version}`."""
+    version = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    with staging.sql_client() as client:
+        with client.begin_transaction():
+            client.execute_sql(
+                "CREATE TABLE IF NOT EXISTS public.dataset_versions "
+                "(dataset TEXT NOT NULL, version TEXT NOT NULL, promoted_at TIMESTAMPTZ NOT NULL DEFAULT now(), PRIMARY KEY (dataset, version))"
+            )
+            # serializes promotions of the datasets of this repo
+            client.execute_sql("LOCK TABLE public.dataset_versions IN SHARE ROW EXCLUSIVE MODE")
+            if _schema_exists(client, dataset):
+                rows = client.execute_sql(
+                    "SELECT version FROM public.dataset_versions WHERE dataset = %s ORDER BY promoted_at DESC LIMIT 1", dataset
+                )
+                previous = rows[0][0] if rows else INITIAL_VERSION
+                _carry_tables(client, dataset, f"{dataset}{NEXT_SUFFIX}")
+                client.execute_sql(f'ALTER SCHEMA "{dataset}" RENAME TO "{dataset}__v{previous}"')
+            client.execute_sql(f'ALTER SCHEMA "{dataset}{NEXT_SUFFIX}" RENAME TO "{dataset}"')
+            client.execute_sql("INSERT INTO public.dataset_versions (dataset, version) VALUES (%s, %s)", dataset, version)
+    print(f"Promoted {dataset} version {version}")
+    _drop_old_versions(staging, dataset)
+    return version
+
+
+def _drop_old_versions(pipeline: dlt.Pipeline, dataset: str) -> None:
+    """Drops previous versions of `dataset` beyond the newest `KEEP_DATASET_VERSIONS`"""
+    try:
+        with pipeline.sql_client() as client:
+            rows = client.execute_sql(
+                "SELECT schema_name FROM information_schema.schemata WHERE schema_name LIKE %s ORDER BY schema_name DESC",
+                dataset + r"\_\_v%"
+            )
+            for (schema,) in rows[KEEP_DATASET_VERSIONS:]:
+                print(f"Dropping old version {schema}")
+                client.execute_sql(f'DROP SCHEMA "{schema}" CASCADE')
+    except Exception as e:
+        # old versions are dropped again after the next promotion
+        print(f"Could not drop old versions of {dataset}: {e}")
+
+
+def _full_load(live: dlt.Pipeline, make_source: Callable[[], DltSource], resource: str, later_batches: str = "append", **run_kwargs):
+    """Replaces everything in the live dataset. With `SWAP_SCHEMAS`, the data is loaded into `{dataset}_next`
+    and promoted once complete, so queries never see a truncated or half loaded table."""
+    pipeline = _staging_pipeline(live) if SWAP_SCHEMAS else live
+    if CHECKPOINT_PAGES:
+        load_info = _run_checkpointed(pipeline, make_source, resource, later_batches, **run_kwargs)
+    else:
+        load_info = pipeline.run(make_source(), **run_kwargs, **LOAD_OPTIONS)
+    if SWAP_SCHEMAS:
+        _promote(pipeline, live.dataset_name)
+    return load_info
+
+def load_issues_data(owner: str, repo: str, destination: str, access_token: str | None = None, incremental: bool = False) -> None:
+    """Loads all issues and their reactions for the specified repo.
+    With `incremental`, only issues updated since the last load are fetched and merged."""
     pipeline = dlt.pipeline(
         f"{owner.lower()}_{repo.lower()}_github_issues",
         destination=dlt.destinations.postgres(destination),
@@ -10,19 +201,27 @@ def load_issues_data(owner: str, repo: str, destination: str, access_token: str
     )
 
     # Initialize the data source with the specified parameters
-    data = github_reactions(
-        owner=owner,
-        name=repo,
-        access_token=access_token,
-        items_per_page=100
-    ).with_resources('issues')
+    def data():
+        return github_reactions(
+            owner=owner,
+            name=repo,
+            access_token=access_token,
+            items_per_page=100,
+            incremental=incremental,
+            updated_since=_high_water_mark(pipeline, "issues", "updated_at") if incremental else None,
+            batch_pages=CHECKPOINT_PAGES
+        ).with_resources('issues')
     
     # Run the pipeline and print the outcome
-    load_info = pipeline.run(data, table_name="issues")
+    if incremental:
+        load_info = pipeline.run(data(), table_name="issues", **LOAD_OPTIONS)
+    else:
+        load_info = _full_load(pipeline, data, "issues", table_name="issues")
     print(f"Loaded issues:{load_info}", load_info)
 
-def load_pull_requests_data(owner: str, repo: str, destination: str, access_token: str | None = None) -> None:
-    """Loads all pull requests and their reactions for the specified repo"""
+def load_pull_requests_data(owner: str, repo: str, destination: str, access_token: str | None = None, incremental: bool = False) -> None:
+    """Loads all pull requests and their reactions for the specified repo.
+    With `incremental`, only pull requests updated since the last load are fetched and merged."""
     print(destination)
     pipeline = dlt.pipeline(
          f"{owner.lower()}_{repo.lower()}_github_prs",
@@ -31,29 +230,50 @@ def load_pull_requests_data(owner: str, repo: str, destination: str, access_toke
     )
 
     # Initialize the data source with the specified parameters
-    data = github_reactions(
-        owner=owner,
-        name=repo,
-        access_token=access_token,
-        items_per_page=100
-    ).with_resources('pull_requests')
+    def data():
+        return github_reactions(
+            owner=owner,
+            name=repo,
+            access_token=access_token,
+            items_per_page=100,
+            incremental=incremental,
+            updated_since=_high_water_mark(pipeline, "pull_requests", "updated_at") if incremental else None,
+            batch_pages=CHECKPOINT_PAGES
+        ).with_resources('pull_requests')
     
     # Run the pipeline and print the outcome
-    load_info = pipeline.run(data, table_name="pull_requests")
+    if incremental:
+        load_info = pipeline.run(data(), table_name="pull_requests", **LOAD_OPTIONS)
+    else:
+        load_info = _full_load(pipeline, data, "pull_requests", table_name="pull_requests")
     print(f"Loaded pull requests:{load_info}")
 
-def load_stargazer_data(owner:str, repo:str, destination: str, access_token:str | None = None) -> None:
-    """Loads all stargazers for dlthub dlt repo"""
+def load_stargazer_data(owner:str, repo:str, destination: str, access_token:str | None = None, incremental: bool = False) -> None:
+    """Loads all stargazers for the specified repo.
+    With `incremental`, only stars given since the last load are fetched and merged."""
     pipeline = dlt.pipeline(
         f"{owner.lower()}_{repo.lower()}_github_stargazers",
         destination=dlt.destinations.postgres(destination),
         dataset_name="stargazers"
     )
-    data = github_stargazers(owner, repo, access_token= access_token)
-    print(pipeline.run(data))
+    def data():
+        return github_stargazers(
+            owner,
+            repo,
+            access_token=access_token,
+            incremental=incremental,
+            starred_since=_high_water_mark(pipeline, "stargazers", "starred_at") if incremental else None,
+            batch_pages=CHECKPOINT_PAGES
+        )
+    if incremental:
+        print(pipeline.run(data(), **LOAD_OPTIONS))
+    else:
+        print(_full_load(pipeline, data, "stargazers"))
 
-def load_commit_data(owner: str, repo: str, destination: str, access_token: str | None = None) -> None:
-    """Loads all commits for the specified repo"""
+def load_commit_data(owner: str, repo: str, destination: str, access_token: str | None = None, incremental: bool = False, partitioned: bool = False) -> None:
+    """Loads all commits for the specified repo.
+    With `incremental`, only commits made since the last load are fetched and merged.
+    With `partitioned`, a full load fetches time windows of the history concurrently."""
     pipeline = dlt.pipeline(
         f"{owner.lower()}_{repo.lower()}_github_commits",
         destination=dlt.destinations.postgres(destination),
@@ -61,16 +281,56 @@ def load_commit_data(owner: str, repo: str, destination: str, access_token: str
     )
 
     # Initialize the data source with the specified parameters
-    data = github_commits(
-        owner=owner,
-        name=repo,
-        access_token=access_token,
-        items_per_page=100
-    )
+    def data():
+        return github_commits(
+            owner=owner,
+            name=repo,
+            access_token=access_token,
+            items_per_page=100,
+            incremental=incremental,
+            committed_since=_high_water_mark(pipeline, "commits", "committed_date") if incremental else None,
+            partitioned=partitioned,
+            batch_pages=CHECKPOINT_PAGES
+        )
     
     # Run the pipeline and print the outcome
-    load_info = pipeline.run(data)
+    if incremental:
+        load_info = pipeline.run(data(), **LOAD_OPTIONS)
+    else:
+        # commits on partition boundaries can be fetched by two batches of a partitioned load
+        load_info = _full_load(pipeline, data, "commits", later_batches="merge" if partitioned else "append")
     print(f"Loaded commits: {load_info}")
 
+def load_comment_reactions(owner: str, repo: str, destination: str, access_token: str | None = None, dataset: str = "issues") -> int:
+    """Loads the reactions of comments flagged with `has_reactions` into the `comment_reactions` table
+    of the issues or pull_requests dataset. Only comments of items updated since the previous enrichment
+    are fetched. Returns the number of comments looked up."""
+    pipeline = dlt.pipeline(
+        f"{owner.lower()}_{repo.lower()}_github_{dataset}_reactions",
+        destination=dlt.destinations.postgres(destination),
+        dataset_name=dataset
+    )
+    enriched_until = _high_water_mark(pipeline, "comment_reactions", "item_updated_at")
+    try:
+        with pipeline.sql_client() as client:
+            rows = client.execute_sql(
+                f"SELECT c.id, i.updated_at FROM {client.make_qualified_table_name(dataset + '__comments')} c "
+                f"JOIN {client.make_qualified_table_name(dataset)} i ON c._dlt_parent_id = i._dlt_id "
+                f"WHERE c.has_reactions" + (" AND i.updated_at > %s" if enriched_until else ""),
+                *([enriched_until] if enriched_until else [])
+            )
+    except Exception as e:
+        print(f"No comments to enrich in {dataset}: {e}")
+        return 0
+    if not rows:
+        print(f"No new reacted comments in {dataset}")
+        return 0
 
+    item_updated_at = {comment_id: updated_at for comment_id, updated_at in rows}
+    data = github_comment_reactions(list(item_updated_at), access_token=access_token)
+    # keep the update time of the parent item, it is the high-water mark of the next enrichment
+    data.comment_reactions.add_map(lambda row: {**row, "item_updated_at": item_updated_at[row["comment_id"]]})
+    load_info = pipeline.run(data, **LOAD_OPTIONS)
+    print(f"Loaded comment reactions: {load_info}")
+    return len(rows)
 
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+from fastapi.encoders import jsonable_encoder
+
+
+def normalize_prompt(prompt: str) -> str:
+    """lowercase, collapse whitespace and drop trailing punctuation"""
+    prompt = re.sub(r"\s+", " ", prompt.strip().lower())
+    return prompt.rstrip("?.! ")
+
+
+class MemoryBackend:
+    """In-process LRU store with per-entry expiry, bounded by entries and by bytes"""
+
+    def __init__(self, max_size: int, max_bytes: int):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple[str, str, float, str]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+
+    def get(self, key: str, ttl: float) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[2] > ttl:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[3]
+
+    def _remove(self, key: str) -> None:
+        self._bytes -= len(self._entries.pop(key)[3])
+
+    def set(self, key: str, owner: str, repo: str, value: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (owner, repo, time.time(), value)
+            self._bytes += len(value)
+            while self._entries and (len(self._entries) > self.max_size or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def purge(self, owner: str, repo: str) -> None:
+        with self._lock:
+            for key in [k for k, v in self._entries.items() if v[0] == owner and v[1] == repo]:
+                self._remove(key)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    def size_bytes(self) -> int:
+        return self._bytes
+
+
+class SQLiteBackend:
+    """On-disk store so cached answers survive restarts and are shared by uvicorn workers"""
+
+    def __init__(self, path: str, max_size: int, max_bytes: int):
+        self.path = path
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS answers (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    repo TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    value TEXT NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_repo ON answers (owner, repo)")
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_accessed_at ON answers (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str, ttl: float) -> Optional[str]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT created_at, value FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[0] > ttl:
+                conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE answers SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[1]
+
+    def set(self, key: str, owner: str, repo: str, value: str) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answers (key, owner, repo, created_at, accessed_at, value) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, owner, repo, now, now, value)
+            )
+            conn.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,)
+            )
+            # least recently used entries beyond the byte budget
+            conn.execute(
+                """DELETE FROM answers WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(length(CAST(value AS BLOB))) OVER (ORDER BY accessed_at DESC, key) AS total FROM answers
+                    ) WHERE total > ?
+                )""",
+                (self.max_bytes,)
+            )
+
+    def purge(self, owner: str, repo: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM answers WHERE owner = ? AND repo = ?", (owner, repo))
+
+    def size(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def size_bytes(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COALESCE(SUM(length(CAST(value AS BLOB))), 0) FROM answers").fetchone()[0]
+
+
+class AnswerCache:
+    """Caches generated SQL and formatted results for /data.
+
+    Keys combine the repo, the normalized prompt and the repo data version, so answers
+    computed against older data are never returned. Answers are stored the way they are sent, so a hit
+    returns the same value types as the first response. For results larger than `max_entry_bytes`
+    only the SQL is kept, the rows are read again on a hit.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 86400,
+        max_size: int = 10000,
+        path: Optional[str] = None,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_entry_bytes: int = 1024 * 1024
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entry_bytes = max_entry_bytes
+        self.backend = SQLiteBackend(path, max_size, max_bytes) if path else MemoryBackend(max_size, max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.sql_only = 0
+
+    @staticmethod
+    def _key(owner: str, repo: str, prompt: str, data_version: str) -> str:
+        raw = json.dumps([owner.lower(), repo.lower(), normalize_prompt(prompt), data_version])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, owner: str, repo: str, prompt: str, data_version: str) -> Optional[dict]:
+        value = self.backend.get(self._key(owner, repo, prompt, data_version), self.ttl_seconds)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, owner: str, repo: str, prompt: str, data_version: str, answer: dict) -> None:
+        value = json.dumps(jsonable_encoder(answer))
+        if len(value) > self.max_entry_bytes:
+            self.sql_only += 1
+            value = json.dumps({"sql": answer["sql"], "columns": None, "values": None})
+        self.backend.set(
+            self._key(owner, repo, prompt, data_version),
+            owner.lower(),
+            repo.lower(),
+            value
+        )
+
+    def purge(self, owner: str, repo: str) -> None:
+        self.backend.purge(owner.lower(), repo.lower())
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "size": self.backend.size(),
+            "bytes": self.backend.size_bytes(),
+            "sql_only": self.sql_only,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,109 @@
+import asyncio
+from typing import Optional
+
+
+class Overloaded(Exception):
+    """Raised when a limiter's wait queue is full, or a queued request waited too long"""
+
+    def __init__(self, resource: str, retry_after: int):
+        super().__init__(f"Too many pending requests for {resource}")
+        self.resource = resource
+        self.retry_after = retry_after
+
+
+class BoundedLimiter:
+    """Semaphore with a bounded wait queue.
+
+    At most `max_concurrency` holders run at once and at most `max_queue` callers wait;
+    anything beyond that fails fast with `Overloaded` instead of piling up until timeouts.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float, retry_after: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._active = 0
+
+    async def acquire(self) -> None:
+        if not self._semaphore.locked():
+            # a free slot is taken without yielding to the event loop
+            await self._semaphore.acquire()
+            self._active += 1
+            return
+
+        if self._waiting >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(self.name, self.retry_after)
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Overloaded(self.name, self.retry_after)
+        finally:
+            self._waiting -= 1
+        self._active += 1
+
+    def release(self) -> None:
+        self._active -= 1
+        self._semaphore.release()
+
+    async def __aenter__(self) -> "BoundedLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+        }
+
+
+class PromptLimits:
+    """Global limiter for LLM calls and one limiter per repo database for SQL execution"""
+
+    def __init__(
+        self,
+        llm_concurrency: int = 8,
+        llm_queue_depth: int = 32,
+        sql_concurrency_per_repo: int = 4,
+        sql_queue_depth_per_repo: int = 16,
+        queue_timeout: float = 30,
+        retry_after: int = 5
+    ):
+        self.llm = BoundedLimiter("llm", llm_concurrency, llm_queue_depth, queue_timeout, retry_after)
+        self.sql_concurrency_per_repo = sql_concurrency_per_repo
+        self.sql_queue_depth_per_repo = sql_queue_depth_per_repo
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._sql: dict[str, BoundedLimiter] = {}
+
+    def sql(self, source_name: str) -> BoundedLimiter:
+        limiter: Optional[BoundedLimiter] = self._sql.get(source_name)
+        if limiter is None:
+            limiter = BoundedLimiter(
+                f"sql:{source_name}",
+                self.sql_concurrency_per_repo,
+                self.sql_queue_depth_per_repo,
+                self.queue_timeout,
+                self.retry_after
+            )
+            self._sql[source_name] = limiter
+        return limiter
+
+    def stats(self) -> dict:
+        return {
+            "llm": self.llm.stats(),
+            "sql": {name: limiter.stats() for name, limiter in self._sql.items()},
+        }
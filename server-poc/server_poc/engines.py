@@ -0,0 +1,123 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from sqlalchemy import Engine, create_engine
+
+from .concurrency import Overloaded
+
+
+class EngineRegistry:
+    """Pooled SQLAlchemy engines for the per-repo analytical databases.
+
+    Every repo database gets one small pool (`pool_size` + `max_overflow` connections). The sum over all
+    pools is capped by `max_total_connections`: when a new repo needs a pool, idle pools of cold repos are
+    disposed, least recently used first.
+    """
+
+    def __init__(
+        self,
+        database_uri: str,
+        pool_size: int = 2,
+        max_overflow: int = 3,
+        max_total_connections: int = 100,
+        idle_seconds: float = 600,
+        pool_recycle: int = 1800,
+        retry_after: int = 5
+    ):
+        self.database_uri = database_uri
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.max_total_connections = max_total_connections
+        self.idle_seconds = idle_seconds
+        self.pool_recycle = pool_recycle
+        self.retry_after = retry_after
+        self.created = 0
+        self.evicted = 0
+        self._engines: "OrderedDict[str, tuple[Engine, float]]" = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def _connections_per_engine(self) -> int:
+        return self.pool_size + self.max_overflow
+
+    def get(self, source_name: str) -> Engine:
+        with self._lock:
+            self._evict_idle()
+            entry = self._engines.get(source_name)
+            if entry is None:
+                self._make_room()
+                engine = create_engine(
+                    f"{self.database_uri}/{source_name}",
+                    pool_size=self.pool_size,
+                    max_overflow=self.max_overflow,
+                    pool_pre_ping=True,
+                    pool_recycle=self.pool_recycle,
+                )
+                self.created += 1
+            else:
+                engine = entry[0]
+            self._engines[source_name] = (engine, time.monotonic())
+            self._engines.move_to_end(source_name)
+            return engine
+
+    def _evict_idle(self) -> None:
+        now = time.monotonic()
+        for source_name, (engine, last_used) in list(self._engines.items()):
+            if now - last_used > self.idle_seconds and engine.pool.checkedout() == 0:
+                self._dispose(source_name)
+
+    def _make_room(self) -> None:
+        while (len(self._engines) + 1) * self._connections_per_engine > self.max_total_connections:
+            # least recently used first
+            idle = next(
+                (name for name, (engine, _) in self._engines.items() if engine.pool.checkedout() == 0),
+                None
+            )
+            if idle is None:
+                raise Overloaded("database connections", self.retry_after)
+            self._dispose(idle)
+
+    def _dispose(self, source_name: str) -> None:
+        engine, _ = self._engines.pop(source_name)
+        engine.dispose()
+        self.evicted += 1
+
+    def evict_idle(self) -> None:
+        with self._lock:
+            self._evict_idle()
+
+    def dispose(self, source_name: str) -> None:
+        """Disposes the engine of a repo that is no longer served, unless its connections are in use"""
+        with self._lock:
+            entry = self._engines.get(source_name)
+            if entry is not None and entry[0].pool.checkedout() == 0:
+                self._dispose(source_name)
+
+    def dispose_all(self) -> None:
+        with self._lock:
+            for source_name in list(self._engines):
+                self._dispose(source_name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            pools = {
+                name: {
+                    "size": engine.pool.size(),
+                    "checked_in": engine.pool.checkedin(),
+                    "checked_out": engine.pool.checkedout(),
+                    "overflow": engine.pool.overflow(),
+                    "idle_seconds": round(now - last_used, 1),
+                }
+                for name, (engine, last_used) in self._engines.items()
+            }
+            return {
+                "engines": len(self._engines),
+                "max_total_connections": self.max_total_connections,
+                "allocated_connections": len(self._engines) * self._connections_per_engine,
+                "checked_out": sum(pool["checked_out"] for pool in pools.values()),
+                "created": self.created,
+                "evicted": self.evicted,
+                "pools": pools,
+            }
@@ -0,0 +1,124 @@
+import json
+import os
+import re
+import time
+from typing import NamedTuple
+
+from sqlalchemy import create_engine, text
+
+
+class IndexSpec(NamedTuple):
+    schema: str
+    table: str
+    column: str
+    method: str
+
+    @property
+    def name(self) -> str:
+        return f"ix_{self.table}_{self.column}"
+
+
+_FROM_TABLE = re.compile(r"^\s*SELECT\s+(?P<columns>.+?)\s+FROM\s+(?P<schema>\w+)\.(?P<table>\w+)\s*$", re.IGNORECASE | re.DOTALL)
+_TIME_COLUMN = re.compile(r"_(at|date)$")
+_KEY_COLUMN = re.compile(r"(^|__)(login|number)$")
+
+
+def index_specs(path: str = "semantic_layer/") -> list[IndexSpec]:
+    """Indexes for the columns the metrics filter and group on: BRIN for timestamps, which are loaded
+    roughly in time order, and btree for logins and numbers"""
+    specs = {}
+    for file_name in sorted(os.listdir(path)):
+        if not file_name.endswith(".json") or file_name == "examples.json":
+            continue
+        with open(os.path.join(path, file_name)) as f:
+            metric = json.load(f)
+        match = _FROM_TABLE.match(metric.get("sql_to_underlying_datasource", ""))
+        if not match:
+            continue
+        dtypes = {dimension["name"]: dimension.get("dtype") or "" for dimension in metric.get("dimensions", [])}
+        # timestamps only read by measures, e.g. closed_at, are not declared as dimensions
+        columns = list(dtypes) + [column.strip().lower() for column in match.group("columns").split(",")]
+        for column in columns:
+            if dtypes.get(column, "").upper().startswith("TIMESTAMP") or _TIME_COLUMN.search(column):
+                method = "brin"
+            elif _KEY_COLUMN.search(column):
+                method = "btree"
+            else:
+                continue
+            spec = IndexSpec(match.group("schema"), match.group("table"), column, method)
+            specs[(spec.schema, spec.table, spec.column)] = spec
+    return list(specs.values())
+
+
+def _probe(spec: IndexSpec) -> str:
+    """A typical filter of the metrics on the indexed column"""
+    target = f'"{spec.schema}"."{spec.table}"'
+    if spec.method == "brin":
+        return f"SELECT count(*) FROM {target} WHERE \"{spec.column}\" >= now() - interval '30 days'"
+    if spec.column == "number":
+        return f'SELECT * FROM {target} WHERE "number" = 1'
+    return f"SELECT count(*) FROM {target} WHERE \"{spec.column}\" = 'octocat'"
+
+
+def _plan_cost(connection, spec: IndexSpec) -> float:
+    plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {_probe(spec)}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]["Total Cost"]
+
+
+def build_indexes(database_url: str, semantic_layer_path: str = "semantic_layer/") -> dict:
+    """Creates the indexes of `index_specs` on the loaded tables of a repo database without blocking readers,
+    analyzes the tables and reports the planner cost of a probe query per index before and after."""
+    started = time.monotonic()
+    report = {}
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    engine = create_engine(database_url, isolation_level="AUTOCOMMIT")
+    try:
+        with engine.connect() as connection:
+            existing = {
+                (schema, table, column)
+                for schema, table, column in connection.execute(text(
+                    "SELECT table_schema, table_name, column_name FROM information_schema.columns"
+                ))
+            }
+            specs = [spec for spec in index_specs(semantic_layer_path) if (spec.schema, spec.table, spec.column) in existing]
+            tables = sorted({(spec.schema, spec.table) for spec in specs})
+
+            for schema, table in tables:
+                connection.execute(text(f'ANALYZE "{schema}"."{table}"'))
+            before = {spec: _plan_cost(connection, spec) for spec in specs}
+
+            for spec in specs:
+                # an interrupted concurrent build leaves an invalid index behind that IF NOT EXISTS would keep
+                invalid = connection.execute(text(
+                    "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                    "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                    "WHERE n.nspname = :schema AND c.relname = :name AND NOT i.indisvalid"
+                ), {"schema": spec.schema, "name": spec.name}).first()
+                if invalid:
+                    connection.execute(text(f'DROP INDEX CONCURRENTLY "{spec.schema}"."{spec.name}"'))
+                index_started = time.monotonic()
+                connection.execute(text(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{spec.name}" '
+                    f'ON "{spec.schema}"."{spec.table}" USING {spec.method} ("{spec.column}")'
+                ))
+                report[f"{spec.schema}.{spec.table}.{spec.column}"] = {
+                    "method": spec.method,
+                    "seconds": round(time.monotonic() - index_started, 2),
+                }
+
+            for schema, table in tables:
+                connection.execute(text(f'ANALYZE "{schema}"."{table}"'))
+            for spec in specs:
+                entry = report[f"{spec.schema}.{spec.table}.{spec.column}"]
+                entry["cost_before"] = before[spec]
+                entry["cost_after"] = _plan_cost(connection, spec)
+    finally:
+        engine.dispose()
+
+    seconds = time.monotonic() - started
+    for column, entry in report.items():
+        print(f"Index on {column} ({entry['method']}): probe cost {entry['cost_before']:.1f} -> {entry['cost_after']:.1f}")
+    print(f"Building {len(report)} indexes took {seconds:.1f}s")
+    return {"seconds": round(seconds, 2), "indexes": report}
@@ -1,2 +1,5 @@
 from .githubrepoinfo import GithubRepoInfo as GithubRepoInfo, PipelineStatus as PipelineStatus
-from .user_prompt import UserPrompt as UserPrompt, PromptType as PromptType
\ No newline at end of file
+from .user_prompt import UserPrompt as UserPrompt, PromptType as PromptType
+from .pipeline_job import PipelineJob as PipelineJob, JobStatus as JobStatus, JobPriority as JobPriority
+from .github_token import GithubToken as GithubToken
+from .github_token_usage import GithubTokenUsage as GithubTokenUsage
@@ -0,0 +1,14 @@
+from datetime import datetime
+from sqlmodel import Field, SQLModel, Column, DateTime
+from sqlalchemy import MetaData
+
+
+class GithubToken(SQLModel, table=True):
+    """Token registered for the ingestion pool, used next to the token a pipeline run was started with"""
+    metadata = MetaData()
+    id: int | None = Field(default=None, primary_key=True)
+    token: str
+    token_hash: str = Field(index=True, unique=True)
+    label: str | None = None
+    created_at: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
+    revoked_at: datetime | None = Field(default=None, sa_column=Column(DateTime(timezone=True)))
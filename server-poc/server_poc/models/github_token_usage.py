@@ -0,0 +1,13 @@
+from datetime import datetime
+from sqlmodel import Field, SQLModel, Column, DateTime
+from sqlalchemy import MetaData
+
+
+class GithubTokenUsage(SQLModel, table=True):
+    """Lowest primary rate limit count any worker process saw for a token in the current window"""
+    metadata = MetaData()
+    token_hash: str = Field(primary_key=True)
+    rate_limit: int | None = None
+    remaining: int
+    reset_at: datetime | None = Field(default=None, sa_column=Column(DateTime(timezone=True)))
+    updated_at: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
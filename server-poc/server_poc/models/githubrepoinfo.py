@@ -2,14 +2,21 @@ from data_pipelines.github_pipeline import (
     load_issues_data,
     load_pull_requests_data,
     load_stargazer_data,
-    load_commit_data
+    load_commit_data,
+    load_comment_reactions
 )
+from data_pipelines.github.http_client import get_http_client, stats_delta
+from data_pipelines.github.token_pool import get_token_pool
+from data_pipelines.github.retry import get_retry_policy, retry_stats_delta
 from datetime import datetime
 from enum import Enum
 from sqlmodel import Field, SQLModel, Column, DateTime
 from sqlalchemy_utils import create_database, database_exists
-from sqlalchemy import MetaData
+from sqlalchemy import Index, MetaData
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
+import time
+import traceback
 
 class PipelineStatus(Enum):
     RUNNING = 1
@@ -18,6 +25,9 @@ class PipelineStatus(Enum):
 
 
 class GithubRepoInfo(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_githubrepoinfo_owner_repo_name", "owner", "repo_name", unique=True),
+    )
     metadata = MetaData()
     id: int | None = Field(default=None, primary_key=True)
     owner: str
@@ -48,61 +58,136 @@ class GithubRepoInfo(SQLModel, table=True):
 
 
     def load_data(self, access_token: str, load_issues=True, load_pull_requests=True, 
-                 load_stars=True, load_commits=True):
-        """Loads data for the repo from the GitHub API into postgres using DLT helper files"""
+                 load_stars=True, load_commits=True, full_refresh=False):
+        """Loads data for the repo from the GitHub API into postgres using DLT helper files.
+        Resources loaded successfully before are refreshed incrementally unless `full_refresh` is set."""
         print(f'Loading github data for {self.owner}/{self.repo_name}')
         
         DATABASE_URI = os.environ.get('GITHUB_DATABASE_CONNECTION_URI')
         destination_url = f"{DATABASE_URI}/{self.source_name()}"
+
+        # A repo that has never been loaded has its flags at their default, so check the last run too
+        has_loaded = self.last_pipeline_run is not None and not full_refresh
+        incremental_stars = has_loaded and self.loaded_stars
+        incremental_issues = has_loaded and self.loaded_issues
+        incremental_pull_requests = has_loaded and self.loaded_pull_requests
+        incremental_commits = has_loaded and self.loaded_commits
         
         # Reset loaded flags
         self.loaded_stars = False
         self.loaded_issues = False
         self.loaded_pull_requests = False
         self.loaded_commits = False
-        
+
+        # full commit loads fetch windows of the history concurrently
+        partition_commits = os.environ.get('PIPELINE_PARTITION_COMMITS', '1') != '0' and not incremental_commits
+
+        # (flag set on success, loader, incremental, extra loader options) for every requested resource
+        loads = []
         if load_stars:
-            try:
-                load_stargazer_data(self.owner, self.repo_name, destination_url, access_token=access_token)
-                self.loaded_stars = True
-            except Exception as e:
-                print(f"Failed to load star data: {e}")
-                
-                
+            loads.append(('loaded_stars', load_stargazer_data, incremental_stars, {}))
         if load_issues:
-            try:
-                load_issues_data(self.owner, self.repo_name, destination_url, access_token=access_token)
-                self.loaded_issues = True
-            except Exception as e:
-                print(f"Failed to load issues data: {e}")
-
+            loads.append(('loaded_issues', load_issues_data, incremental_issues, {}))
         if load_commits:
-            try:
-                load_commit_data(self.owner, self.repo_name, destination_url, access_token=access_token)
-                self.loaded_commits = True
-            except Exception as e:
-                print(f"Failed to load commit data: {e}")
-                
-                
+            loads.append(('loaded_commits', load_commit_data, incremental_commits, {'partitioned': partition_commits}))
         if load_pull_requests:
+            loads.append(('loaded_pull_requests', load_pull_requests_data, incremental_pull_requests, {}))
+
+        def timed_load(loader, incremental, options):
+            started = time.monotonic()
             try:
-                load_pull_requests_data(self.owner, self.repo_name, destination_url, access_token=access_token)
-                self.loaded_pull_requests = True
+                loader(self.owner, self.repo_name, destination_url, access_token=access_token, incremental=incremental, **options)
+                return time.monotonic() - started, None
             except Exception as e:
-                import traceback
-                print(f"Failed to load pull requests data: {e}")
-                print("Stack trace:")
                 print(traceback.format_exc())
-                
+                return time.monotonic() - started, e
+
+        # every resource has its own dlt pipeline, so they can run side by side.
+        # GraphQL requests of the same token share one budget, see data_pipelines.github.rate_limit
+        workers = int(os.environ.get('PIPELINE_LOAD_WORKERS', 4))
+        timings = {}
+        http_before = get_http_client().stats.snapshot()
+        retries_before = get_retry_policy().stats.snapshot()
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(loads) or 1))) as executor:
+            futures = {
+                executor.submit(timed_load, loader, incremental, options): (flag, incremental)
+                for flag, loader, incremental, options in loads
+            }
+            for future in as_completed(futures):
+                flag, incremental = futures[future]
+                seconds, error = future.result()
+                resource = flag.removeprefix('loaded_')
+                if error is None:
+                    setattr(self, flag, True)
+                else:
+                    print(f"Failed to load {resource} data: {error}")
+                timings[resource] = {
+                    "seconds": round(seconds, 2),
+                    "incremental": incremental,
+                    "loaded": error is None,
+                }
+                print(f"Loading {resource} for {self.owner}/{self.repo_name} took {seconds:.1f}s")
+
+        # the HTTP client is shared by the whole process, so this also counts concurrent runs
+        http_stats = stats_delta(http_before, get_http_client().stats.snapshot())
+        print(f"GitHub HTTP usage for {self.owner}/{self.repo_name}: {http_stats}")
+        retry_stats = retry_stats_delta(retries_before, get_retry_policy().stats.snapshot())
+        if retry_stats["retries"]:
+            print(f"GitHub retries for {self.owner}/{self.repo_name}: {retry_stats}")
 
-    
         # If nothing was loaded successfully, raise an exception
         if not any([self.loaded_stars, self.loaded_issues, 
                     self.loaded_pull_requests, self.loaded_commits]):
             raise Exception("Failed to load any data")
-        
-       
 
+        return {"resources": timings, "http": http_stats, "retries": retry_stats, "tokens": get_token_pool().stats()}
+
+    def enrich_comment_reactions(self, access_token) -> dict:
+        """Loads the reactions of issue and pull request comments into `comment_reactions` tables.
+        Runs after the primary load, failures are only logged. Returns per-dataset timings."""
+        DATABASE_URI = os.environ.get('GITHUB_DATABASE_CONNECTION_URI')
+        destination_url = f"{DATABASE_URI}/{self.source_name()}"
+        timings = {}
+        for dataset, loaded in (("issues", self.loaded_issues), ("pull_requests", self.loaded_pull_requests)):
+            if not loaded:
+                continue
+            started = time.monotonic()
+            try:
+                comments = load_comment_reactions(self.owner, self.repo_name, destination_url, access_token=access_token, dataset=dataset)
+                error = None
+            except Exception as e:
+                print(traceback.format_exc())
+                comments, error = 0, str(e)
+            seconds = time.monotonic() - started
+            timings[f"{dataset}_reactions"] = {"seconds": round(seconds, 2), "comments": comments, "error": error}
+            print(f"Enriching {dataset} comment reactions for {self.owner}/{self.repo_name} took {seconds:.1f}s")
+        return timings
+
+    def loaded_metrics(self) -> list[str]:
+        """Names of the semantic layer metrics backed by successfully loaded data"""
+        metrics = []
+        if self.loaded_commits:
+            metrics.append('commit_activity')
+        if self.loaded_issues:
+            metrics.append('issue_tracking')
+        if self.loaded_pull_requests:
+            metrics.append('pull_request_status')
+        if self.loaded_stars:
+            metrics.append('repository_stars')
+        return metrics
+
+    def has_loaded_data(self) -> bool:
+        """Whether an earlier pipeline run loaded data. Refreshes leave it queryable, see `github_pipeline._promote`"""
+        return self.last_pipeline_run is not None and bool(self.loaded_metrics())
+
+    def data_version(self) -> str:
+        """Identifies the loaded data for the repo. Changes whenever a pipeline run finishes"""
+        last_run = self.last_pipeline_run.isoformat() if self.last_pipeline_run else "never"
+        loaded = "".join(
+            "1" if flag else "0"
+            for flag in (self.loaded_commits, self.loaded_issues, self.loaded_pull_requests, self.loaded_stars)
+        )
+        return f"{last_run}:{loaded}"
 
     def source_name(self) -> str:
         """lowercase and remove special characters"""
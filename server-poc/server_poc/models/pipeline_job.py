@@ -0,0 +1,43 @@
+from datetime import datetime
+from enum import Enum
+from sqlmodel import Field, SQLModel, Column, DateTime, JSON
+from sqlalchemy import Index, MetaData
+
+
+class JobStatus(Enum):
+    QUEUED = 1
+    RUNNING = 2
+    SUCCESS = 3
+    FAILED = 4
+
+
+class JobPriority:
+    """Lower values are claimed first"""
+    NEW_REPO = 0
+    REFRESH = 10
+
+
+class PipelineJob(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_pipelinejob_claim", "status", "priority", "created_at"),
+    )
+    metadata = MetaData()
+    id: int | None = Field(default=None, primary_key=True)
+    repo_id: int = Field(index=True)
+    priority: int = Field(default=JobPriority.REFRESH)
+    status: JobStatus = Field(default=JobStatus.QUEUED)
+    # the token is needed to run the job after a restart and cleared once the job finished,
+    # token_hash groups jobs per token
+    access_token: str | None = None
+    token_hash: str = Field(index=True)
+    load_options: dict = Field(default_factory=dict, sa_column=Column(JSON))
+    # per-resource load timings and HTTP usage of the last attempt
+    timings: dict | None = Field(default=None, sa_column=Column(JSON))
+    attempts: int = Field(default=0)
+    max_attempts: int = Field(default=3)
+    worker_id: str | None = None
+    error: str | None = None
+    created_at: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
+    started_at: datetime | None = Field(default=None, sa_column=Column(DateTime(timezone=True)))
+    heartbeat_at: datetime | None = Field(default=None, sa_column=Column(DateTime(timezone=True)))
+    finished_at: datetime | None = Field(default=None, sa_column=Column(DateTime(timezone=True)))
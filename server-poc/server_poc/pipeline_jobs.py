@@ -0,0 +1,202 @@
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import Engine, func, text
+from sqlmodel import Session, select
+
+from .indexes import build_indexes
+from .models import GithubRepoInfo, GithubToken, PipelineStatus, PipelineJob, JobStatus
+from data_pipelines.github.settings import ENRICH_REACTIONS, GITHUB_TOKEN_POOL
+from data_pipelines.github.token_pool import get_token_pool
+
+
+# serializes claims so the per-token cap can't be exceeded by workers claiming at the same moment
+_CLAIM_LOCK_ID = 72_016_001
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def token_hash(access_token: str) -> str:
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+
+def enqueue_pipeline_job(session: Session, repo: GithubRepoInfo, access_token: str, priority: int, **load_options) -> PipelineJob:
+    """Queues a pipeline run for the repo. The caller commits the session."""
+    job = PipelineJob(
+        repo_id=repo.id,
+        priority=priority,
+        access_token=access_token,
+        token_hash=token_hash(access_token),
+        load_options=load_options,
+        created_at=_now()
+    )
+    session.add(job)
+    return job
+
+
+def claim_next_job(engine: Engine, worker_id: str, max_jobs_per_token: int) -> Optional[PipelineJob]:
+    """Claims the most urgent queued job whose token is below its concurrency cap.
+    Uses SELECT ... FOR UPDATE SKIP LOCKED so workers never block on each other's rows.
+    """
+    with Session(engine) as session:
+        session.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": _CLAIM_LOCK_ID})
+
+        busy_tokens = (
+            select(PipelineJob.token_hash)
+            .where(PipelineJob.status == JobStatus.RUNNING)
+            .group_by(PipelineJob.token_hash)
+            .having(func.count() >= max_jobs_per_token)
+        )
+        job = session.exec(
+            select(PipelineJob)
+            .where(PipelineJob.status == JobStatus.QUEUED)
+            .where(PipelineJob.token_hash.not_in(busy_tokens))
+            .order_by(PipelineJob.priority, PipelineJob.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        ).first()
+
+        if job is None:
+            return None
+
+        job.status = JobStatus.RUNNING
+        job.worker_id = worker_id
+        job.attempts += 1
+        job.started_at = _now()
+        job.heartbeat_at = job.started_at
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+        return job
+
+
+def heartbeat(engine: Engine, job_id: int) -> None:
+    with Session(engine) as session:
+        job = session.get(PipelineJob, job_id)
+        if job is not None and job.status == JobStatus.RUNNING:
+            job.heartbeat_at = _now()
+            session.add(job)
+            session.commit()
+
+
+def finish_job(engine: Engine, job_id: int, error: Optional[str] = None, timings: Optional[dict] = None) -> None:
+    with Session(engine) as session:
+        job = session.get(PipelineJob, job_id)
+        job.status = JobStatus.FAILED if error else JobStatus.SUCCESS
+        job.access_token = None
+        job.error = error
+        job.timings = timings
+        job.finished_at = _now()
+        session.add(job)
+        session.commit()
+
+
+def recover_stuck_jobs(engine: Engine, stale_after: timedelta) -> int:
+    """Requeues running jobs whose worker stopped sending heartbeats, or fails them when out of attempts.
+    Also fails repos left in RUNNING without any queued or running job, e.g. by a restart mid-run.
+    Returns the number of recovered jobs.
+    """
+    recovered = 0
+    with Session(engine) as session:
+        stale_jobs = session.exec(
+            select(PipelineJob)
+            .where(PipelineJob.status == JobStatus.RUNNING)
+            .where(PipelineJob.heartbeat_at < _now() - stale_after)
+            .with_for_update(skip_locked=True)
+        ).all()
+        for job in stale_jobs:
+            print(f"Recovering job {job.id} of repo {job.repo_id} from worker {job.worker_id}")
+            if job.attempts < job.max_attempts:
+                job.status = JobStatus.QUEUED
+                job.worker_id = None
+            else:
+                job.status = JobStatus.FAILED
+                job.access_token = None
+                job.error = "Worker stopped responding"
+                job.finished_at = _now()
+            session.add(job)
+            recovered += 1
+        session.commit()
+
+        active_repo_ids = select(PipelineJob.repo_id).where(
+            PipelineJob.status.in_([JobStatus.QUEUED, JobStatus.RUNNING])
+        )
+        orphaned_repos = session.exec(
+            select(GithubRepoInfo)
+            .where(GithubRepoInfo.pipeline_status == PipelineStatus.RUNNING)
+            .where(GithubRepoInfo.id.not_in(active_repo_ids))
+        ).all()
+        for repo in orphaned_repos:
+            print(f"Repo {repo.owner}/{repo.repo_name} has no pipeline job, marking it as failed")
+            repo.pipeline_status = PipelineStatus.FAILED
+            session.add(repo)
+        session.commit()
+    return recovered
+
+
+def sync_token_pool(engine: Engine) -> None:
+    """Loads the registered tokens into this process' token pool and marks the ones GitHub rejected as revoked."""
+    pool = get_token_pool()
+    rejected = {token_hash(token) for token in pool.revoked}
+    with Session(engine) as session:
+        tokens = session.exec(select(GithubToken)).all()
+        for token in tokens:
+            if token.revoked_at is None and token.token_hash in rejected:
+                print(f"Marking pooled token {token.label or token.id} as revoked")
+                token.revoked_at = _now()
+                session.add(token)
+        session.commit()
+        pool.set_tokens([*GITHUB_TOKEN_POOL, *(t.token for t in tokens if t.revoked_at is None)])
+
+
+def register_token(session: Session, token: str, label: Optional[str] = None) -> GithubToken:
+    """Adds a token to the pool, or reactivates it when it was registered before. The caller commits the session."""
+    existing = session.exec(select(GithubToken).where(GithubToken.token_hash == token_hash(token))).first()
+    if existing is not None:
+        existing.revoked_at = None
+        existing.label = label or existing.label
+        session.add(existing)
+        return existing
+    registered = GithubToken(token=token, token_hash=token_hash(token), label=label, created_at=_now())
+    session.add(registered)
+    return registered
+
+
+def run_pipeline(engine: Engine, repo_id: int, access_token: str, on_success: Optional[Callable[[GithubRepoInfo], None]] = None, **load_options) -> dict:
+    """Loads the repo data and records the outcome on the repo row. Returns the per-resource timings."""
+    with Session(engine) as session:
+        repo = session.exec(
+            select(GithubRepoInfo)
+            .where(GithubRepoInfo.id == repo_id)
+        ).first()
+        try:
+            # Load the data with the specified options
+            timings = repo.load_data(access_token, **load_options)
+            # Commit the changes
+            repo.pipeline_status = PipelineStatus.SUCCESS
+            repo.last_pipeline_run = datetime.now()
+            session.add(repo)
+            session.commit()
+            if on_success is not None:
+                on_success(repo)
+            if os.environ.get('PIPELINE_BUILD_INDEXES', '1') != '0':
+                try:
+                    database_url = f"{os.environ.get('GITHUB_DATABASE_CONNECTION_URI')}/{repo.source_name()}"
+                    timings["indexes"] = build_indexes(database_url)
+                except Exception as e:
+                    print(f"Failed to build indexes for {repo.owner}/{repo.repo_name}: {e}")
+            # the repo is already queryable while reactions are enriched
+            if ENRICH_REACTIONS:
+                timings["enrichment"] = repo.enrich_comment_reactions(access_token)
+            return timings
+
+        except Exception as e:
+            repo.last_pipeline_run = datetime.now()
+            repo.pipeline_status = PipelineStatus.FAILED
+            session.add(repo)
+            session.commit()
+            raise e
@@ -0,0 +1,62 @@
+import time
+from threading import Lock
+from typing import Callable, Optional
+
+from sqlalchemy import event
+
+from .models import GithubRepoInfo
+
+
+class RepoInfoCache:
+    """Read-through cache of `GithubRepoInfo` rows keyed by (owner, repo_name).
+
+    Rows are dropped whenever this process inserts, updates or deletes them. The TTL bounds how long
+    writes made by other processes (other uvicorn workers, pipeline workers) can go unnoticed.
+    """
+
+    def __init__(self, ttl_seconds: float = 5):
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._repos: dict[tuple[str, str], tuple[GithubRepoInfo, float]] = {}
+        self._lock = Lock()
+        for event_name in ("after_insert", "after_update", "after_delete"):
+            event.listen(GithubRepoInfo, event_name, self._on_write)
+
+    @staticmethod
+    def _key(owner: str, repo_name: str) -> tuple[str, str]:
+        return owner.lower(), repo_name.lower()
+
+    def _on_write(self, mapper, connection, target: GithubRepoInfo) -> None:
+        self.invalidate(target.owner, target.repo_name)
+
+    def get(self, owner: str, repo_name: str, load: Callable[[], Optional[GithubRepoInfo]]) -> Optional[GithubRepoInfo]:
+        """Returns the cached row, calling `load` on a miss. Missing repos are not cached.
+        Returned rows are detached from any session and must be treated as read only.
+        """
+        key = self._key(owner, repo_name)
+        with self._lock:
+            entry = self._repos.get(key)
+            if entry is not None and time.monotonic() - entry[1] <= self.ttl_seconds:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        repo = load()
+        if repo is not None:
+            with self._lock:
+                self._repos[key] = (repo, time.monotonic())
+        return repo
+
+    def invalidate(self, owner: str, repo_name: str) -> None:
+        with self._lock:
+            self._repos.pop(self._key(owner, repo_name), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._repos),
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
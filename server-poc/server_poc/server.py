@@ -1,17 +1,35 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from .models import GithubRepoInfo, PipelineStatus, UserPrompt, PromptType
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Header
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
+from .models import GithubRepoInfo, PipelineStatus, UserPrompt, PromptType, PipelineJob, JobPriority, GithubToken, GithubTokenUsage
+from .source_registry import SourceRegistry
+from .answer_cache import AnswerCache, normalize_prompt
+from .sql_templates import match_template
+from .singleflight import SingleFlight
+from .concurrency import Overloaded, PromptLimits
+from .engines import EngineRegistry
+from .repo_cache import RepoInfoCache
+from .pipeline_jobs import enqueue_pipeline_job, register_token
+from .worker import start_workers, stop_workers
 from sqlmodel import Session, create_engine, select
-from sqlalchemy import Engine
+from sqlalchemy import Connection, Engine, text
 from relta import Client
 from relta.datasource import DataSource
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
+import asyncio
 import os
 import os.path
-from typing import Optional
+from typing import AsyncIterator, Iterator, Optional
 from datetime import datetime, timedelta
 import traceback
+import uuid
+import base64
+import hashlib
+import json
 from typing import TypedDict
 
     
@@ -20,6 +38,9 @@ load_dotenv()
 
 app = FastAPI()
 
+# held by the server process that runs the embedded pipeline worker pool
+_WORKER_POOL_LOCK_ID = 72_016_002
+
 class Prompt(BaseModel):
     # chat_id: str
     prompt: str
@@ -29,6 +50,11 @@ class Feedback(BaseModel):
     type: str
     message: dict
 
+class TokenRegistration(BaseModel):
+    token: str
+    label: Optional[str] = None
+
+
 class FeedbackResponse(TypedDict):
     status: str
     pr_url: str
@@ -40,6 +66,22 @@ class ServerState:
         self.client: Optional[Client] = None
         self.database_uri: Optional[str] = None
         self.engine: Optional[Engine] = None
+        self.source_registry = SourceRegistry(max_size=int(os.environ.get('SOURCE_CACHE_SIZE', 32)))
+        self.answer_cache: Optional[AnswerCache] = None
+        self.repo_engines: Optional[EngineRegistry] = None
+        self.pipeline_workers: list = []
+        self.worker_pool_lock: Optional[Connection] = None
+        self.engine_eviction: Optional[asyncio.Task] = None
+        self.repo_cache = RepoInfoCache(ttl_seconds=float(os.environ.get('REPO_CACHE_TTL_SECONDS', 5)))
+        self.prompt_flights = SingleFlight()
+        self.prompt_limits = PromptLimits(
+            llm_concurrency=int(os.environ.get('LLM_CONCURRENCY', 8)),
+            llm_queue_depth=int(os.environ.get('LLM_QUEUE_DEPTH', 32)),
+            sql_concurrency_per_repo=int(os.environ.get('SQL_CONCURRENCY_PER_REPO', 4)),
+            sql_queue_depth_per_repo=int(os.environ.get('SQL_QUEUE_DEPTH_PER_REPO', 16)),
+            queue_timeout=float(os.environ.get('PROMPT_QUEUE_TIMEOUT_SECONDS', 30)),
+            retry_after=int(os.environ.get('PROMPT_RETRY_AFTER_SECONDS', 5))
+        )
 
 server_state = ServerState()
 
@@ -65,95 +107,189 @@ def _get_repo_source_name(owner: str, repo_name: str) -> str:
     return source_name
 
 
+def _get_cached_repo_info(owner: str, repo_name: str) -> Optional[GithubRepoInfo]:
+    """Read-only repo row from the repo cache, loaded from the database on a miss"""
+    def load() -> Optional[GithubRepoInfo]:
+        with Session(server_state.engine) as session:
+            return session.exec(
+                select(GithubRepoInfo)
+                .where(GithubRepoInfo.owner == owner.lower())
+                .where(GithubRepoInfo.repo_name == repo_name.lower())
+            ).first()
+
+    return server_state.repo_cache.get(owner, repo_name, load)
+
+
 def _create_relta_source_and_deploy_semantic_layer(owner: str, repo_name: str) -> DataSource:
-    with Session(server_state.engine) as session:
-        # Get a fresh copy of the repo object within this session
-        repo = session.exec(
-            select(GithubRepoInfo)
-            .where(GithubRepoInfo.owner== owner.lower())
-            .where(GithubRepoInfo.repo_name==repo_name.lower())
-        ).first()
-    
-        if repo is None:
-            raise HTTPException(
-                status_code=404,
-                detail="The repo is not connected"
-            )
+    repo = _get_cached_repo_info(owner, repo_name)
 
-        if repo.pipeline_status == PipelineStatus.FAILED or repo.pipeline_status == PipelineStatus.RUNNING:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Data not accessible. The pipeline is {repo.pipeline_status}"
-            )
+    if repo is None:
+        raise HTTPException(
+            status_code=404,
+            detail="The repo is not connected"
+        )
 
-        # Build list of semantic layer paths based on successfully loaded data types
-        metrics_to_load = []
-        if repo.loaded_commits:
-            metrics_to_load.extend(['commit_activity'])
-        if repo.loaded_issues:
-            metrics_to_load.append('issue_tracking')
-        if repo.loaded_pull_requests:
-            metrics_to_load.append('pull_request_status')
-        if repo.loaded_stars:
-            metrics_to_load.append('repository_stars')
-
-        source = server_state.client.get_or_create_datasource(
-            connection_uri=f"{server_state.database_uri}/{repo.source_name()}",
-            name=repo.source_name()
+    # a refresh keeps serving the last promoted data, only the first load blocks queries
+    if repo.pipeline_status == PipelineStatus.FAILED or (
+        repo.pipeline_status == PipelineStatus.RUNNING and not repo.has_loaded_data()
+    ):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Data not accessible. The pipeline is {repo.pipeline_status}"
         )
 
-       
-        source.semantic_layer.load(path='semantic_layer/', metrics_to_load=metrics_to_load)
+    return server_state.source_registry.get_or_create(
+        repo.source_name(),
+        repo.data_version(),
+        lambda: _deploy_semantic_layer(repo, owner, repo_name)
+    )
 
-        ##this is a hack so LLM knows all the data is for the given repo
-        for metric in source.semantic_layer.metrics:
-            metric.description = f"{metric.description} All data is from the {owner}/{repo_name} GitHub repository."  
-        source.deploy()
 
-        return source
+def _deploy_semantic_layer(repo: GithubRepoInfo, owner: str, repo_name: str) -> DataSource:
+    # Build list of semantic layer paths based on successfully loaded data types
+    metrics_to_load = repo.loaded_metrics()
 
+    source = server_state.client.get_or_create_datasource(
+        connection_uri=f"{server_state.database_uri}/{repo.source_name()}",
+        name=repo.source_name()
+    )
 
+    source.semantic_layer.load(path='semantic_layer/', metrics_to_load=metrics_to_load)
 
-def _format_data(sql: str, data: list[tuple]) -> list[dict]:
-    """Convert database tuple results into a list of dicts with column names as keys.
-    Also converts datetime objects to ISO format strings.
-    
-    Args:
-        sql: The SQL query that was executed (used to extract column names)
-        data: List of tuples containing the query results
-        
-    Returns:
-        List of dictionaries with column names as keys
+    ##this is a hack so LLM knows all the data is for the given repo
+    for metric in source.semantic_layer.metrics:
+        metric.description = f"{metric.description} All data is from the {owner}/{repo_name} GitHub repository."  
+    source.deploy()
+
+    return source
+
+
+
+def _get_repo_engine(source_name: str) -> Engine:
+    return server_state.repo_engines.get(source_name)
+
+
+def _execute_sql(source_name: str, sql: str) -> tuple[list[str], list[tuple]]:
+    """Runs SQL against the repo database and names columns from the cursor description"""
+    with _get_repo_engine(source_name).connect() as connection:
+        result = connection.execute(text(sql))
+        return list(result.keys()), result.fetchall()
+
+
+def _result_columns(sql: str, width: Optional[int]) -> list[str]:
+    """Column names of the outermost SELECT of a statement whose cursor we don't own (Relta's).
+    `width` is the row width, None when there are no rows to check the names against.
+    Falls back to positional names if they can't be matched to the row width.
     """
-    from datetime import datetime
-    from sqlglot import parse_one, exp
+    from sqlglot import parse_one
 
-    # Extract column names from SQL query using sqlglot
-    columns = []
     try:
-        parsed = parse_one(sql)
-        for select in parsed.find_all(exp.Select):
-            for projection in select.expressions:
-                columns.append(projection.alias_or_name)
+        columns = parse_one(sql, read="postgres").named_selects
     except Exception as e:
         print(e)
-        return []
+        columns = []
 
-    if not columns:
-        return []
-    
-    # Convert each tuple to a dict with column names
-    formatted_data = []
-    for row in data:
-        row_dict = {}
-        for i, value in enumerate(row):
-            # Convert datetime objects to ISO format strings
-            if isinstance(value, datetime):
-                value = value.isoformat()
-            row_dict[columns[i]] = value
-        formatted_data.append(row_dict)
-    
-    return formatted_data
+    if width is None:
+        # the width of `*` is unknown without a row
+        return [] if "*" in columns else [name or f"column_{i}" for i, name in enumerate(columns)]
+    if len(columns) != width:
+        return [f"column_{i}" for i in range(width)]
+    return columns
+
+
+def _column_values(data: list[tuple], width: int) -> list[list]:
+    """Transposes rows into columns and serializes datetime columns to ISO strings in one pass per column."""
+    if not data:
+        return [[] for _ in range(width)]
+
+    values = [list(column) for column in zip(*data)]
+    for i, column in enumerate(values):
+        sample = next((value for value in column if value is not None), None)
+        if isinstance(sample, datetime):
+            values[i] = [value.isoformat() if isinstance(value, datetime) else value for value in column]
+    return values
+
+
+def _format_columns(columns: list[str], values: list[list], columnar: bool = False) -> list[dict] | dict:
+    if columnar:
+        return {"columns": columns, "data": dict(zip(columns, values))}
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def _literal_int(node) -> Optional[int]:
+    """Value of a LIMIT/OFFSET clause, None when absent. Raises ValueError for anything but a number."""
+    if node is None:
+        return None
+    if not node.expression.is_int:
+        raise ValueError(f"{node.sql()} is not a number")
+    return int(node.expression.this)
+
+
+def _page_sql(connection, sql: str, limit: Optional[int], offset: int) -> str:
+    """A page of the statement's rows in a stable order: every output column is appended to its ORDER BY,
+    so consecutive pages neither repeat nor skip rows. Its own LIMIT/OFFSET is folded into the page."""
+    from sqlglot import exp, parse_one
+
+    width = len(connection.execute(text(f"SELECT * FROM ({sql}) AS probe LIMIT 0")).keys())
+    tiebreak = [exp.Literal.number(i) for i in range(1, width + 1)]
+    try:
+        statement = parse_one(sql, read="postgres")
+        own_limit = _literal_int(statement.args.get("limit"))
+        own_offset = _literal_int(statement.args.get("offset")) or 0
+    except Exception:
+        statement = None
+    if not isinstance(statement, exp.Select):
+        # e.g. a UNION, or a LIMIT we can't fold, ordered as a whole
+        order = ", ".join(str(i) for i in range(1, width + 1))
+        page = f"SELECT * FROM ({sql}) AS page ORDER BY {order}"
+        if limit is not None:
+            page += f" LIMIT {int(limit)}"
+        return page + f" OFFSET {int(offset)}"
+
+    if own_limit is not None:
+        limit = max(0, own_limit - offset) if limit is None else max(0, min(limit, own_limit - offset))
+    statement = statement.order_by(*tiebreak, append=True, copy=True).offset(own_offset + offset)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement.sql(dialect="postgres")
+
+
+def _stream_sql(source_name: str, sql: str, limit: Optional[int], offset: int, chunk_size: int) -> Iterator[tuple[list[str], list[tuple], bool]]:
+    """Executes SQL with a server-side cursor and yields (columns, rows, has_more) chunks,
+    so only `chunk_size` rows are held in memory at a time.
+    """
+    sql = sql.strip().rstrip(';')
+
+    with _get_repo_engine(source_name).connect() as connection:
+        if limit is not None or offset:
+            # fetch one extra row to know whether another page exists
+            sql = _page_sql(connection, sql, limit + 1 if limit is not None else None, offset)
+        result = connection.execution_options(stream_results=True, max_row_buffer=chunk_size).execute(text(sql))
+        columns = list(result.keys())
+        sent = 0
+        for partition in result.partitions(chunk_size):
+            if limit is not None and sent + len(partition) > limit:
+                yield columns, partition[:limit - sent], True
+                return
+            sent += len(partition)
+            yield columns, partition, False
+        if sent == 0:
+            yield columns, [], False
+
+
+def _sql_hash(sql: str) -> str:
+    return hashlib.sha256(sql.encode()).hexdigest()[:16]
+
+
+def _encode_cursor(sql: str, offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"sql": _sql_hash(sql), "offset": offset}).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> dict:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
 
 
 def initialize_server(force_refresh: bool = False):
@@ -173,7 +309,34 @@ def initialize_server(force_refresh: bool = False):
     server_state.engine = create_engine(f'{server_state.database_uri}/github_assistant')
     # Create all tables using the GitHub-specific metadata
     GithubRepoInfo.metadata.create_all(server_state.engine)
+    # create_all skips indexes on tables that already exist
+    for index in GithubRepoInfo.__table__.indexes:
+        try:
+            index.create(server_state.engine, checkfirst=True)
+        except Exception as e:
+            print(f"Could not create index {index.name}: {e}")
     UserPrompt.metadata.create_all(server_state.engine)
+    PipelineJob.metadata.create_all(server_state.engine)
+    GithubToken.metadata.create_all(server_state.engine)
+    GithubTokenUsage.metadata.create_all(server_state.engine)
+
+    server_state.repo_engines = EngineRegistry(
+        server_state.database_uri,
+        pool_size=int(os.environ.get('REPO_DB_POOL_SIZE', 2)),
+        max_overflow=int(os.environ.get('REPO_DB_MAX_OVERFLOW', 3)),
+        max_total_connections=int(os.environ.get('REPO_DB_MAX_TOTAL_CONNECTIONS', 100)),
+        idle_seconds=float(os.environ.get('REPO_DB_IDLE_SECONDS', 600))
+    )
+    # repos dropped from the source registry are cold, their connection pools are released
+    server_state.source_registry.on_evict = server_state.repo_engines.dispose
+
+    server_state.answer_cache = AnswerCache(
+        ttl_seconds=float(os.environ.get('ANSWER_CACHE_TTL_SECONDS', 86400)),
+        max_size=int(os.environ.get('ANSWER_CACHE_SIZE', 10000)),
+        path=os.environ.get('ANSWER_CACHE_PATH'),
+        max_bytes=int(os.environ.get('ANSWER_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+        max_entry_bytes=int(os.environ.get('ANSWER_CACHE_MAX_ENTRY_BYTES', 1024 * 1024))
+    )
 
     # Initialize Relta client
     server_state.client = Client()
@@ -182,42 +345,114 @@ def initialize_server(force_refresh: bool = False):
 
 
 
+def _get_prompt_repo(owner: str, repo_name: str) -> GithubRepoInfo | dict:
+    """Returns the repo row if its data can be queried, or the status payload to send back instead"""
+    repo_info = _get_cached_repo_info(owner, repo_name)
+
+    if repo_info is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Repository '{owner}/{repo_name}' not found"
+        )
+
+    if repo_info.pipeline_status == PipelineStatus.RUNNING and not repo_info.has_loaded_data():
+        return {
+            "status": "RUNNING",
+            "message": "Pipeline is currently running. Please try again later."
+        }
+
+    if repo_info.pipeline_status == PipelineStatus.FAILED:
+        return {
+            "status": "FAILED",
+            "message": "Pipeline failed to load data. Please try reloading the data."
+        }
+    return repo_info
+
+
+def _prompt_llm(owner: str, repo_name: str, prompt: str, **prompt_options):
+    source = _create_relta_source_and_deploy_semantic_layer(owner, repo_name)
+    chat = server_state.client.create_chat(source)
+    return chat.prompt(prompt, **prompt_options)
+
+
+async def _answer_data_prompt(prompt: str, owner: str, repo_name: str, source_name: str, data_version: str, metrics_loaded: list[str]) -> dict:
+    """Answers a /data prompt with templated SQL when possible, otherwise through the LLM.
+    Rows are returned column-major in `values` so each caller can pick its own output format.
+    """
+    # known question shapes are answered with templated SQL, skipping the LLM
+    template = match_template(prompt, metrics_loaded)
+    if template is not None:
+        async with server_state.prompt_limits.sql(source_name):
+            columns, data = await run_in_threadpool(_execute_sql, source_name, template.sql)
+        return {
+            "text": None,
+            "sql": template.sql,
+            "columns": columns,
+            "values": _column_values(data, len(columns)),
+            "chat": {"id": str(uuid.uuid4())},
+            "served_by": "template"
+        }
+
+    # Relta executes the generated SQL itself, so the LLM slot covers that query too
+    async with server_state.prompt_limits.llm:
+        response = await run_in_threadpool(_prompt_llm, owner, repo_name, prompt, mode='data_only')
+    columns = values = None
+    if response.sql is not None:
+        width = len(response.sql_result[0]) if response.sql_result else None
+        columns = _result_columns(response.sql, width)
+        values = _column_values(response.sql_result, len(columns))
+        response.sql_result = None
+        await run_in_threadpool(
+            server_state.answer_cache.set,
+            owner, repo_name, prompt, data_version,
+            {"sql": response.sql, "columns": columns, "values": values}
+        )
+    payload = jsonable_encoder(response)
+    payload.update({"columns": columns, "values": values, "served_by": "llm"})
+    return payload
+
+
 @app.post("/data", tags=["prompt"])
-def add_prompt_get_data(prompt: Prompt, owner: str, repo_name: str, background_task: BackgroundTasks):
+async def add_prompt_get_data(prompt: Prompt, owner: str, repo_name: str, background_task: BackgroundTasks, columnar: bool = False):
     # Check repo name validity before entering try block
-    with Session(server_state.engine) as session:
-        repo_info = session.exec(
-            select(GithubRepoInfo)
-            .where(GithubRepoInfo.owner == owner.lower())
-            .where(GithubRepoInfo.repo_name == repo_name.lower())
-        ).first()
-        
-        if repo_info is None:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Repository '{owner}/{repo_name}' not found"
-            )
-        
-        if repo_info.pipeline_status == PipelineStatus.RUNNING:
-            return {
-                "status": "RUNNING",
-                "message": "Pipeline is currently running. Please try again later."
-            }
-        
-        if repo_info.pipeline_status == PipelineStatus.FAILED:
-            return {
-                "status": "FAILED",
-                "message": "Pipeline failed to load data. Please try reloading the data."
-            }
+    repo_info = await run_in_threadpool(_get_prompt_repo, owner, repo_name)
+    if isinstance(repo_info, dict):
+        return repo_info
+    data_version = repo_info.data_version()
+    source_name = repo_info.source_name()
+    metrics_loaded = repo_info.loaded_metrics()
+
+    background_task.add_task(record_user_prompt, prompt.prompt, owner, repo_name, PromptType.FULL_TEXT)
+    cached = await run_in_threadpool(server_state.answer_cache.get, owner, repo_name, prompt.prompt, data_version)
+    if cached is not None and cached["values"] is None:
+        # only the SQL of large results is cached
+        async with server_state.prompt_limits.sql(source_name):
+            columns, data = await run_in_threadpool(_execute_sql, source_name, cached["sql"])
+        cached = {"sql": cached["sql"], "columns": columns, "values": _column_values(data, len(columns))}
+    if cached is not None:
+        return {
+            "text": None,
+            "sql": cached["sql"],
+            "sql_result": _format_columns(cached["columns"], cached["values"], columnar),
+            "chat": {"id": str(uuid.uuid4())},
+            "served_by": "cache"
+        }
+
     try:
-        source = _create_relta_source_and_deploy_semantic_layer(owner, repo_name)       
-        chat = server_state.client.create_chat(source)
-        background_task.add_task(record_user_prompt, prompt.prompt, owner, repo_name, PromptType.FULL_TEXT)
-        response = chat.prompt(prompt.prompt, mode='data_only')
-        if response.sql is not None:
-            response.sql_result = _format_data(sql=response.sql, data = response.sql_result)
-        return response
+        answer = await server_state.prompt_flights.do(
+            (owner.lower(), repo_name.lower(), normalize_prompt(prompt.prompt), data_version),
+            lambda: _answer_data_prompt(prompt.prompt, owner, repo_name, source_name, data_version, metrics_loaded)
+        )
+        # the answer may be shared with coalesced requests, so format a copy
+        payload = dict(answer)
+        columns = payload.pop("columns")
+        values = payload.pop("values")
+        if columns is not None:
+            payload["sql_result"] = _format_columns(columns, values, columnar)
+        return payload
     
+    except (HTTPException, Overloaded):
+        raise
     except Exception as e:
         print(traceback.format_exc())
         print(e)
@@ -227,40 +462,125 @@ def add_prompt_get_data(prompt: Prompt, owner: str, repo_name: str, background_t
         )
 
 
+@app.post("/data/stream", tags=["prompt"])
+async def stream_prompt_data(
+    prompt: Prompt,
+    owner: str,
+    repo_name: str,
+    background_task: BackgroundTasks,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
+):
+    """Streams the rows answering a prompt as NDJSON.
+
+    The first line holds the SQL and column names, followed by `rows` chunks and a final `end`
+    line with the row count and, when `limit` is set, a `next_cursor` for the following page.
+    """
+    repo_info = await run_in_threadpool(_get_prompt_repo, owner, repo_name)
+    if isinstance(repo_info, dict):
+        return repo_info
+    data_version = repo_info.data_version()
+    source_name = repo_info.source_name()
+    metrics_loaded = repo_info.loaded_metrics()
+
+    if limit is not None and limit <= 0:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+
+    try:
+        if cursor is None:
+            background_task.add_task(record_user_prompt, prompt.prompt, owner, repo_name, PromptType.FULL_TEXT)
+
+        # only the SQL is needed here, rows are read again through a server-side cursor
+        cached = await run_in_threadpool(server_state.answer_cache.get, owner, repo_name, prompt.prompt, data_version)
+        template = match_template(prompt.prompt, metrics_loaded) if cached is None else None
+        if cached is not None:
+            sql, served_by = cached["sql"], "cache"
+        elif template is not None:
+            sql, served_by = template.sql, "template"
+        else:
+            answer = await server_state.prompt_flights.do(
+                (owner.lower(), repo_name.lower(), normalize_prompt(prompt.prompt), data_version),
+                lambda: _answer_data_prompt(prompt.prompt, owner, repo_name, source_name, data_version, metrics_loaded)
+            )
+            if answer["sql"] is None:
+                return {key: value for key, value in answer.items() if key not in ("columns", "values")}
+            sql, served_by = answer["sql"], answer["served_by"]
+    except (HTTPException, Overloaded):
+        raise
+    except Exception as e:
+        print(traceback.format_exc())
+        print(e)
+        raise HTTPException(
+            status_code=500,
+            detail="An unknown error occurred"
+        )
+
+    offset = 0
+    if cursor is not None:
+        position = _decode_cursor(cursor)
+        if position.get("sql") != _sql_hash(sql):
+            raise HTTPException(status_code=409, detail="The answer changed since the cursor was issued. Restart pagination.")
+        offset = int(position["offset"])
+
+    chunk_size = int(os.environ.get('STREAM_CHUNK_ROWS', 1000))
+
+    # take the SQL slot before the response starts so overload can still be reported as a 503
+    sql_limiter = server_state.prompt_limits.sql(source_name)
+    await sql_limiter.acquire()
+    released = False
+
+    def release() -> None:
+        # called by the generator when it finishes and by the response once it is done, whichever is
+        # first. the generator never runs when the client is gone before the body is sent
+        nonlocal released
+        if not released:
+            released = True
+            sql_limiter.release()
+
+    async def generate() -> AsyncIterator[str]:
+        try:
+            row_count = 0
+            has_more = False
+            header_sent = False
+            chunks = _stream_sql(source_name, sql, limit, offset, chunk_size)
+            async for columns, rows, has_more in iterate_in_threadpool(chunks):
+                if not header_sent:
+                    yield json.dumps({"type": "meta", "sql": sql, "columns": columns, "served_by": served_by}) + "\n"
+                    header_sent = True
+                if rows:
+                    row_count += len(rows)
+                    values = _column_values(rows, len(columns))
+                    # same value types as /data, e.g. Decimal aggregates as numbers
+                    yield json.dumps(jsonable_encoder({"type": "rows", "rows": [list(row) for row in zip(*values)]})) + "\n"
+            yield json.dumps({
+                "type": "end",
+                "row_count": row_count,
+                "next_cursor": _encode_cursor(sql, offset + row_count) if has_more else None
+            }) + "\n"
+        finally:
+            release()
+
+    try:
+        return StreamingResponse(generate(), media_type="application/x-ndjson", background=BackgroundTask(release))
+    except BaseException:
+        release()
+        raise
+
+
 @app.post("/prompt", tags=["prompt"])
-def add_prompt_to_chat(prompt: Prompt, owner:str, repo_name: str, background_task: BackgroundTasks):
+async def add_prompt_to_chat(prompt: Prompt, owner:str, repo_name: str, background_task: BackgroundTasks):
    
-    with Session(server_state.engine) as session:
-        repo_info = session.exec(
-            select(GithubRepoInfo)
-            .where(GithubRepoInfo.owner == owner.lower())
-            .where(GithubRepoInfo.repo_name == repo_name.lower())
-        ).first()
-        
-        if repo_info is None:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Repository '{owner}/{repo_name}' not found"
-            )
-        
-        if repo_info.pipeline_status == PipelineStatus.RUNNING:
-            return {
-                "status": "RUNNING",
-                "message": "Pipeline is currently running. Please try again later."
-            }
-        
-        if repo_info.pipeline_status == PipelineStatus.FAILED:
-            return {
-                "status": "FAILED",
-                "message": "Pipeline failed to load data. Please try reloading the data."
-            }
+    repo_info = await run_in_threadpool(_get_prompt_repo, owner, repo_name)
+    if isinstance(repo_info, dict):
+        return repo_info
     try:
-        source = _create_relta_source_and_deploy_semantic_layer(owner, repo_name)
         background_task.add_task(record_user_prompt, prompt.prompt, owner, repo_name, PromptType.FULL_TEXT)
-        chat = server_state.client.create_chat(source)
-        response = chat.prompt(prompt.prompt, debug=True)
+        async with server_state.prompt_limits.llm:
+            response = await run_in_threadpool(_prompt_llm, owner, repo_name, prompt.prompt, debug=True)
         return response
         
+    except (HTTPException, Overloaded):
+        raise
     except Exception as e:
         print(e)
         print(traceback.format_exc())
@@ -269,6 +589,15 @@ def add_prompt_to_chat(prompt: Prompt, owner:str, repo_name: str, background_tas
             detail="An unknown error occurred"
         )
 
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 @app.post("/feedback", tags=["feedback"])
 def record_feedback(feedback: Feedback):
     if feedback.type == "positive":
@@ -300,23 +629,18 @@ async def root():
 @app.get("/repo-info", tags=["repos"])
 def get_repo_info(owner: str, repo_name: str):
     """Get repository information for a given owner and repo name."""
-    with Session(server_state.engine) as session:
-        repo_info = session.exec(
-            select(GithubRepoInfo)
-            .where(GithubRepoInfo.owner == owner.lower())
-            .where(GithubRepoInfo.repo_name == repo_name.lower())
-        ).first()
-        
-        if repo_info is None:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Repository '{owner}/{repo_name}' not found"
-            )
-        
-        # Convert to dict and modify pipeline_status to be string
-        repo_dict = repo_info.model_dump()
-        repo_dict['pipeline_status'] = repo_info.pipeline_status.name
-        return repo_dict
+    repo_info = _get_cached_repo_info(owner, repo_name)
+
+    if repo_info is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Repository '{owner}/{repo_name}' not found"
+        )
+
+    # Convert to dict and modify pipeline_status to be string
+    repo_dict = repo_info.model_dump()
+    repo_dict['pipeline_status'] = repo_info.pipeline_status.name
+    return repo_dict
 
 def record_user_prompt(prompt: str, owner: str, repo_name: str, prompt_type: PromptType):
     with Session(server_state.engine) as session:
@@ -333,41 +657,16 @@ def record_user_prompt(prompt: str, owner: str, repo_name: str, prompt_type: Pro
 
 
 
-def background_pipeline_run(repo_id: int, access_token: str, **load_options):
-    with Session(server_state.engine) as session:
-        repo = session.exec(
-            select(GithubRepoInfo)
-            .where(GithubRepoInfo.id == repo_id)
-        ).first()
-        try:
-            # Load the data with the specified options
-            repo.load_data(access_token, **load_options)
-            # Commit the changes
-            repo.pipeline_status = PipelineStatus.SUCCESS
-            repo.last_pipeline_run = datetime.now()
-            session.add(repo)
-            session.commit()
-                 
-            
-        except Exception as e:
-            repo.last_pipeline_run = datetime.now()
-            repo.pipeline_status = PipelineStatus.FAILED
-            session.add(repo)
-            session.commit()
-            raise e
-        
-    #_create_relta_source_and_deploy_semantic_layer(repo.owner, repo.repo)  
-
 @app.post("/load-github-data", tags=["repos"], status_code=201)
 async def load_github_data(
     owner: str,
     repo_name: str,
     access_token: str,
-    background_tasks: BackgroundTasks,
     load_issues: bool = True,
     load_pull_requests: bool = True,
     load_stars: bool = True,
-    load_commits: bool = True
+    load_commits: bool = True,
+    full_refresh: bool = False
 ):
     MIN_REFRESH_SECONDS = int(os.environ.get('MIN_REFRESH_SECONDS', 3600))
     try:
@@ -389,14 +688,16 @@ async def load_github_data(
                 time_since_last_run = datetime.now() - (repo_info.last_pipeline_run or datetime.min)
                 if (repo_info.pipeline_status != PipelineStatus.SUCCESS or 
                     time_since_last_run > timedelta(seconds=MIN_REFRESH_SECONDS)):
-                    background_tasks.add_task(
-                        background_pipeline_run, 
-                        repo_info.id, 
+                    enqueue_pipeline_job(
+                        session,
+                        repo_info,
                         access_token,
+                        JobPriority.REFRESH,
                         load_issues=load_issues,
                         load_pull_requests=load_pull_requests,
                         load_stars=load_stars,
-                        load_commits=load_commits
+                        load_commits=load_commits,
+                        full_refresh=full_refresh
                     )
                     repo_info.pipeline_status = PipelineStatus.RUNNING
                     session.add(repo_info)
@@ -420,16 +721,19 @@ async def load_github_data(
                 repo_info.setup_destination_db(server_state.database_uri)
                 repo_info.pipeline_status = PipelineStatus.RUNNING
                 session.add(repo_info)
-                session.commit()
-                background_tasks.add_task(
-                    background_pipeline_run, 
-                    repo_info.id, 
+                session.flush()
+                enqueue_pipeline_job(
+                    session,
+                    repo_info,
                     access_token,
+                    JobPriority.NEW_REPO,
                     load_issues=load_issues,
                     load_pull_requests=load_pull_requests,
                     load_stars=load_stars,
-                    load_commits=load_commits
-                ) 
+                    load_commits=load_commits,
+                    full_refresh=full_refresh
+                )
+                session.commit()
                 return {
                     "status": "SUCCESS",
                     "message": "Pipeline run trigerred"
@@ -442,6 +746,51 @@ async def load_github_data(
             detail=f"Failed to load GitHub data: {str(e)}"
         )
 
+def _check_admin_key(admin_key: Optional[str]) -> None:
+    expected = os.environ.get('ADMIN_API_KEY')
+    if not expected or admin_key != expected:
+        raise HTTPException(status_code=403, detail="Invalid admin key")
+
+
+@app.post("/admin/tokens", tags=["admin"], status_code=201)
+def add_pool_token(registration: TokenRegistration, x_admin_key: Optional[str] = Header(default=None)):
+    """Register a GitHub token that pipeline runs spread their GraphQL requests over."""
+    _check_admin_key(x_admin_key)
+    with Session(server_state.engine) as session:
+        token = register_token(session, registration.token, registration.label)
+        session.commit()
+        return {"id": token.id, "label": token.label, "token": f"...{registration.token[-4:]}"}
+
+
+@app.get("/admin/tokens", tags=["admin"])
+def list_pool_tokens(x_admin_key: Optional[str] = Header(default=None)):
+    _check_admin_key(x_admin_key)
+    with Session(server_state.engine) as session:
+        tokens = session.exec(select(GithubToken)).all()
+        return [
+            {
+                "id": token.id,
+                "label": token.label,
+                "token": f"...{token.token[-4:]}",
+                "created_at": token.created_at,
+                "revoked_at": token.revoked_at
+            }
+            for token in tokens
+        ]
+
+
+@app.delete("/admin/tokens/{token_id}", tags=["admin"])
+def remove_pool_token(token_id: int, x_admin_key: Optional[str] = Header(default=None)):
+    _check_admin_key(x_admin_key)
+    with Session(server_state.engine) as session:
+        token = session.get(GithubToken, token_id)
+        if token is None:
+            raise HTTPException(status_code=404, detail="Token not found")
+        session.delete(token)
+        session.commit()
+        return {"status": "SUCCESS"}
+
+
 @app.get("/repos", tags=["repos"])
 def get_repos():
     """Get information about all GitHub repositories."""
@@ -457,6 +806,68 @@ def get_repos():
             
         return repos_list
 
+@app.on_event("startup")
+def start_pipeline_workers():
+    """Runs the pipeline worker pool next to the server unless it is deployed separately
+    (`python -m server_poc.worker` with EMBEDDED_PIPELINE_WORKERS=0)."""
+    if os.environ.get('EMBEDDED_PIPELINE_WORKERS', '1') == '0':
+        return
+    # with several uvicorn workers, only the process holding the lock runs the pool.
+    # the lock is held by a connection kept open for the life of the process
+    connection = server_state.engine.connect()
+    if not connection.execute(text("SELECT pg_try_advisory_lock(:lock_id)"), {"lock_id": _WORKER_POOL_LOCK_ID}).scalar():
+        connection.close()
+        print("The pipeline worker pool runs in another server process")
+        return
+    connection.commit()
+    server_state.worker_pool_lock = connection
+    server_state.pipeline_workers = start_workers(int(os.environ.get('PIPELINE_WORKERS') or os.cpu_count() or 1))
+
+
+@app.on_event("shutdown")
+def stop_pipeline_workers():
+    stop_workers(server_state.pipeline_workers)
+    if server_state.worker_pool_lock is not None:
+        server_state.worker_pool_lock.close()
+        server_state.worker_pool_lock = None
+
+
+async def _evict_idle_engines(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(server_state.repo_engines.evict_idle)
+        except Exception as e:
+            print(f"Could not evict idle repo engines: {e}")
+
+
+@app.on_event("startup")
+async def start_engine_eviction():
+    """Disposes the pools of repos that were not queried for `REPO_DB_IDLE_SECONDS`, also when no other repo is queried"""
+    interval = max(1.0, server_state.repo_engines.idle_seconds / 2)
+    server_state.engine_eviction = asyncio.create_task(_evict_idle_engines(interval))
+
+
+@app.on_event("shutdown")
+async def stop_engine_eviction():
+    if server_state.engine_eviction is not None:
+        server_state.engine_eviction.cancel()
+        server_state.engine_eviction = None
+    server_state.repo_engines.dispose_all()
+
+
+@app.get("/stats", tags=["monitoring"])
+def get_stats():
+    """Get cache, concurrency and connection pool counters for the server process."""
+    return {
+        "source_registry": server_state.source_registry.stats(),
+        "answer_cache": server_state.answer_cache.stats(),
+        "prompt_flights": server_state.prompt_flights.stats(),
+        "prompt_limits": server_state.prompt_limits.stats(),
+        "repo_engines": server_state.repo_engines.stats(),
+        "repo_cache": server_state.repo_cache.stats()
+    }
+
 # Initialize server when module loads
 initialize_server(force_refresh=bool(os.environ.get('FORCE_REFRESH')))
 
@@ -0,0 +1,67 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Optional
+
+from relta.datasource import DataSource
+
+
+class SourceRegistry:
+    """Bounded LRU registry of deployed Relta data sources.
+
+    Entries are keyed by the repo source name plus its data version so a finished
+    pipeline run naturally maps to a new entry, which replaces the older versions of the repo.
+    `on_evict` is called with the source name of repos dropped from the registry.
+    """
+
+    def __init__(self, max_size: int = 32, on_evict: Optional[Callable[[str], None]] = None):
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sources: "OrderedDict[tuple[str, str], DataSource]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, source_name: str, data_version: str) -> Optional[DataSource]:
+        key = (source_name, data_version)
+        with self._lock:
+            source = self._sources.get(key)
+            if source is None:
+                self.misses += 1
+                return None
+            self._sources.move_to_end(key)
+            self.hits += 1
+            return source
+
+    def put(self, source_name: str, data_version: str, source: DataSource) -> None:
+        with self._lock:
+            # a repo only ever needs its latest data version
+            for key in [k for k in self._sources if k[0] == source_name and k[1] != data_version]:
+                del self._sources[key]
+            self._sources[(source_name, data_version)] = source
+            self._sources.move_to_end((source_name, data_version))
+            evicted = []
+            while len(self._sources) > self.max_size:
+                (evicted_name, _), _ = self._sources.popitem(last=False)
+                evicted.append(evicted_name)
+                self.evictions += 1
+        if self.on_evict is not None:
+            for evicted_name in evicted:
+                self.on_evict(evicted_name)
+
+    def get_or_create(self, source_name: str, data_version: str, create: Callable[[], DataSource]) -> DataSource:
+        source = self.get(source_name, data_version)
+        if source is None:
+            source = create()
+            self.put(source_name, data_version, source)
+        return source
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._sources),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
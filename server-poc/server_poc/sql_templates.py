@@ -0,0 +1,162 @@
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Callable, NamedTuple, Optional
+
+from .answer_cache import normalize_prompt
+
+
+# matches "the repo", "this repository", "yonom/assistant-ui", "the yonom/assistant-ui repository", ...
+_REPO = r"(?:(?:the|this) )?(?:(?:repo|repository) )?(?:[\w.-]+/[\w.-]+ )?(?:repo|repository|[\w.-]+/[\w.-]+)"
+_FOR_REPO = rf"(?: (?:for|of|on|in) {_REPO})?"
+
+_PERIODS = {
+    "day": "day", "daily": "day",
+    "week": "week", "weekly": "week",
+    "month": "month", "monthly": "month",
+}
+
+
+class QuestionTemplate(NamedTuple):
+    metric: str
+    pattern: re.Pattern
+    build: Callable[[str, re.Match], str]
+
+
+class TemplateMatch(NamedTuple):
+    metric: str
+    sql: str
+
+
+@lru_cache(maxsize=None)
+def _metric_sql(path: str) -> dict[str, str]:
+    """Reads `sql_to_underlying_datasource` of every metric in the semantic layer folder"""
+    metrics = {}
+    for file_name in os.listdir(path):
+        if not file_name.endswith(".json") or file_name == "examples.json":
+            continue
+        with open(os.path.join(path, file_name)) as f:
+            metric = json.load(f)
+        if "sql_to_underlying_datasource" in metric:
+            metrics[metric["name"]] = metric["sql_to_underlying_datasource"]
+    return metrics
+
+
+def _count(alias: str, where: Optional[str] = None) -> Callable[[str, re.Match], str]:
+    def build(source: str, match: re.Match) -> str:
+        sql = f"SELECT COUNT(*) AS {alias} FROM ({source}) AS metric"
+        return f"{sql} WHERE {where}" if where else sql
+    return build
+
+
+def _stars_over_time(source: str, match: re.Match) -> str:
+    period = _PERIODS[match.group("period")]
+    if match.group("cumulative"):
+        return (
+            f"SELECT DATE_TRUNC('{period}', starred_at) AS {period}, "
+            f"SUM(COUNT(*)) OVER (ORDER BY DATE_TRUNC('{period}', starred_at)) AS cumulative_stars "
+            f"FROM ({source}) AS metric GROUP BY 1 ORDER BY 1"
+        )
+    return (
+        f"SELECT DATE_TRUNC('{period}', starred_at) AS {period}, COUNT(*) AS stars "
+        f"FROM ({source}) AS metric GROUP BY 1 ORDER BY 1"
+    )
+
+
+def _commits_over_time(source: str, match: re.Match) -> str:
+    period = _PERIODS[match.group("period")]
+    return (
+        f"SELECT DATE_TRUNC('{period}', committed_date) AS {period}, COUNT(*) AS total_commits "
+        f"FROM ({source}) AS metric GROUP BY 1 ORDER BY 1"
+    )
+
+
+def _top_committers(source: str, match: re.Match) -> str:
+    limit = int(match.groupdict().get("limit") or 1)
+    return (
+        f"SELECT author__user__login, COUNT(*) AS total_commits FROM ({source}) AS metric "
+        f"WHERE author__user__login IS NOT NULL GROUP BY 1 ORDER BY 2 DESC LIMIT {limit}"
+    )
+
+
+def _top_issue_authors(source: str, match: re.Match) -> str:
+    return (
+        f"SELECT author__login, COUNT(*) AS total_issues FROM ({source}) AS metric "
+        f"WHERE author__login IS NOT NULL GROUP BY 1 ORDER BY 2 DESC LIMIT 1"
+    )
+
+
+TEMPLATES = [
+    QuestionTemplate(
+        "repository_stars",
+        re.compile(rf"^(?:how many stars (?:does|do|has) {_REPO} (?:have|got|received)|(?:what is )?(?:the )?(?:total )?(?:number of stars|star count){_FOR_REPO})$"),
+        _count("total_stars"),
+    ),
+    QuestionTemplate(
+        "repository_stars",
+        re.compile(rf"^(?:show (?:a chart of |the number of )?)?(?:(?P<cumulative>cumulative) )?stars (?:received )?per (?P<period>day|week|month){_FOR_REPO}$"),
+        _stars_over_time,
+    ),
+    QuestionTemplate(
+        "repository_stars",
+        re.compile(rf"^show the (?P<cumulative>accumulation) of stars per (?P<period>day|week|month) over time{_FOR_REPO}$"),
+        _stars_over_time,
+    ),
+    QuestionTemplate(
+        "repository_stars",
+        re.compile(rf"^(?P<cumulative>)(?P<period>daily|weekly|monthly) (?:github )?stars{_FOR_REPO}$"),
+        _stars_over_time,
+    ),
+    QuestionTemplate(
+        "commit_activity",
+        re.compile(rf"^how many commits (?:have been made|are there|does {_REPO} have)(?: (?:on|in) {_REPO})?$"),
+        _count("total_commits"),
+    ),
+    QuestionTemplate(
+        "commit_activity",
+        re.compile(r"^(?:the )?number of commits (?:made )?(?:by|per) (?P<period>day|week|month)$"),
+        _commits_over_time,
+    ),
+    QuestionTemplate(
+        "commit_activity",
+        re.compile(r"^(?:who are the top (?P<limit>\d{1,3}) contributors(?: by (?:commit count|commits))?|who has made the most commits)$"),
+        _top_committers,
+    ),
+    QuestionTemplate(
+        "pull_request_status",
+        re.compile(rf"^how many open (?:prs|pull requests) (?:are there|does {_REPO} ha?ve)$"),
+        _count("open_pr_count", "NOT closed"),
+    ),
+    QuestionTemplate(
+        "issue_tracking",
+        re.compile(rf"^how many open issues (?:are there|does {_REPO} have)$"),
+        _count("open_issue_count", "NOT closed"),
+    ),
+    QuestionTemplate(
+        "issue_tracking",
+        re.compile(rf"^how many issues have been (?:created|opened)(?: (?:on|in) {_REPO})?$"),
+        _count("total_issues"),
+    ),
+    QuestionTemplate(
+        "issue_tracking",
+        re.compile(r"^which user has (?:created|opened) the most issues(?: so far)?$"),
+        _top_issue_authors,
+    ),
+]
+
+
+def match_template(prompt: str, metrics_loaded: list[str], semantic_layer_path: str = "semantic_layer/") -> Optional[TemplateMatch]:
+    """Returns SQL for a recognised question shape, or None when the LLM should answer it.
+
+    Only metrics whose data was loaded for the repo are considered.
+    """
+    normalized = normalize_prompt(prompt)
+    metric_sql = _metric_sql(semantic_layer_path)
+    for template in TEMPLATES:
+        if template.metric not in metrics_loaded or template.metric not in metric_sql:
+            continue
+        match = template.pattern.match(normalized)
+        if match:
+            return TemplateMatch(template.metric, template.build(metric_sql[template.metric], match))
+    return None
@@ -0,0 +1,74 @@
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+from sqlalchemy import Engine, text
+
+from data_pipelines.github.rate_limit import RateLimitStore
+
+from .pipeline_jobs import token_hash
+
+
+class PostgresRateLimitStore(RateLimitStore):
+    """Shares the GraphQL limits of a token between the pipeline worker processes.
+
+    Requests in flight hold one of `max_concurrent` session advisory locks of the token, so slots of a
+    crashed process are freed with its connections. The last `rateLimit` block is kept in `githubtokenusage`.
+    """
+
+    def __init__(self, engine: Engine, poll_seconds: float = 0.05):
+        self.engine = engine
+        self.poll_seconds = poll_seconds
+
+    @staticmethod
+    def _lock_key(access_token: Optional[str]) -> int:
+        # the two-key advisory lock space, keyed by a signed 32 bit int of the token
+        return int(token_hash(access_token or "")[:8], 16) - 2 ** 31
+
+    @contextmanager
+    def slot(self, access_token: Optional[str], max_concurrent: int) -> Iterator[None]:
+        key = self._lock_key(access_token)
+        with self.engine.connect() as connection:
+            while True:
+                for slot in range(max_concurrent):
+                    if connection.execute(text("SELECT pg_try_advisory_lock(:key, :slot)"), {"key": key, "slot": slot}).scalar():
+                        connection.commit()
+                        try:
+                            yield
+                        finally:
+                            connection.execute(text("SELECT pg_advisory_unlock(:key, :slot)"), {"key": key, "slot": slot})
+                            connection.commit()
+                        return
+                connection.commit()
+                time.sleep(self.poll_seconds)
+
+    def load(self, access_token: Optional[str]) -> Optional[dict]:
+        with self.engine.connect() as connection:
+            row = connection.execute(
+                text("SELECT rate_limit, remaining, reset_at FROM githubtokenusage WHERE token_hash = :token_hash"),
+                {"token_hash": token_hash(access_token or "")}
+            ).first()
+        if row is None:
+            return None
+        return {"limit": row.rate_limit, "remaining": row.remaining, "reset_at": row.reset_at.timestamp() if row.reset_at else None}
+
+    def save(self, access_token: Optional[str], limit: Optional[int], remaining: int, reset_at: Optional[float]) -> None:
+        # responses of other processes may arrive out of order, keep the lowest count of the newest window
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO githubtokenusage (token_hash, rate_limit, remaining, reset_at, updated_at) "
+                "VALUES (:token_hash, :limit, :remaining, :reset_at, :updated_at) "
+                "ON CONFLICT (token_hash) DO UPDATE SET "
+                "rate_limit = EXCLUDED.rate_limit, "
+                "remaining = CASE WHEN githubtokenusage.reset_at = EXCLUDED.reset_at "
+                "THEN LEAST(githubtokenusage.remaining, EXCLUDED.remaining) ELSE EXCLUDED.remaining END, "
+                "reset_at = EXCLUDED.reset_at, updated_at = EXCLUDED.updated_at "
+                "WHERE githubtokenusage.reset_at IS NULL OR EXCLUDED.reset_at >= githubtokenusage.reset_at"
+            ), {
+                "token_hash": token_hash(access_token or ""),
+                "limit": limit,
+                "remaining": remaining,
+                "reset_at": datetime.fromtimestamp(reset_at, timezone.utc) if reset_at else None,
+                "updated_at": datetime.now(timezone.utc),
+            })
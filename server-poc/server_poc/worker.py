@@ -0,0 +1,141 @@
+"""Pipeline worker pool. Run with `python -m server_poc.worker`.
+
+Each worker process claims queued pipeline jobs from the database, runs them and sends heartbeats
+while they run, so jobs of a crashed or restarted worker are picked up again by the others.
+"""
+import multiprocessing
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+from threading import Event, Thread
+
+from dotenv import load_dotenv
+from sqlmodel import create_engine
+
+from data_pipelines.github.rate_limit import share_limits
+
+from .answer_cache import AnswerCache
+from .models import GithubRepoInfo, GithubToken, GithubTokenUsage, PipelineJob
+from .pipeline_jobs import claim_next_job, finish_job, heartbeat, recover_stuck_jobs, run_pipeline, sync_token_pool
+from .token_usage import PostgresRateLimitStore
+
+
+class WorkerSettings:
+    def __init__(self):
+        self.database_uri = os.environ.get('GITHUB_DATABASE_CONNECTION_URI')
+        self.processes = int(os.environ.get('PIPELINE_WORKERS') or os.cpu_count() or 1)
+        self.max_jobs_per_token = int(os.environ.get('PIPELINE_MAX_JOBS_PER_TOKEN', 2))
+        self.poll_seconds = float(os.environ.get('PIPELINE_POLL_SECONDS', 5))
+        self.heartbeat_seconds = float(os.environ.get('PIPELINE_HEARTBEAT_SECONDS', 30))
+        self.stale_after = timedelta(seconds=float(os.environ.get('PIPELINE_STALE_SECONDS', 300)))
+        self.answer_cache_path = os.environ.get('ANSWER_CACHE_PATH')
+
+
+def _send_heartbeats(engine, job_id: int, interval: float, stop: Event) -> None:
+    while not stop.wait(interval):
+        try:
+            heartbeat(engine, job_id)
+        except Exception as e:
+            print(f"Heartbeat for job {job_id} failed: {e}")
+
+
+def _purge_answers(settings: WorkerSettings):
+    # only a shared on-disk answer cache can be purged from here, in-memory caches key off the data version
+    if not settings.answer_cache_path:
+        return None
+    cache = AnswerCache(path=settings.answer_cache_path)
+    return lambda repo: cache.purge(repo.owner, repo.repo_name)
+
+
+def run_job(engine, settings: WorkerSettings, job: PipelineJob) -> None:
+    stop = Event()
+    beats = Thread(target=_send_heartbeats, args=(engine, job.id, settings.heartbeat_seconds, stop), daemon=True)
+    beats.start()
+    try:
+        sync_token_pool(engine)
+        timings = run_pipeline(engine, job.repo_id, job.access_token, on_success=_purge_answers(settings), **job.load_options)
+        finish_job(engine, job.id, timings=timings)
+    except Exception as e:
+        print(traceback.format_exc())
+        finish_job(engine, job.id, error=str(e))
+    finally:
+        stop.set()
+        beats.join()
+        try:
+            sync_token_pool(engine)
+        except Exception as e:
+            print(f"Could not sync the token pool: {e}")
+
+
+def worker_loop(worker_id: str) -> None:
+    load_dotenv()
+    settings = WorkerSettings()
+    engine = create_engine(f'{settings.database_uri}/github_assistant', pool_pre_ping=True)
+    # GitHub's limits apply per token, whichever process the requests come from
+    share_limits(
+        PostgresRateLimitStore(create_engine(f'{settings.database_uri}/github_assistant', pool_size=5, max_overflow=20, pool_pre_ping=True)),
+        settings.processes
+    )
+    last_recovery = 0.0
+    print(f"Pipeline worker {worker_id} started")
+    while True:
+        try:
+            if time.monotonic() - last_recovery > settings.heartbeat_seconds:
+                recover_stuck_jobs(engine, settings.stale_after)
+                last_recovery = time.monotonic()
+
+            job = claim_next_job(engine, worker_id, settings.max_jobs_per_token)
+            if job is None:
+                time.sleep(settings.poll_seconds)
+                continue
+            print(f"Worker {worker_id} running job {job.id} for repo {job.repo_id}")
+            run_job(engine, settings, job)
+        except Exception as e:
+            print(f"Worker {worker_id} error: {e}")
+            time.sleep(settings.poll_seconds)
+
+
+def start_workers(processes: int) -> list[multiprocessing.Process]:
+    """Starts the worker processes. They are not daemonic since dlt may start processes of its own."""
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for i in range(processes):
+        worker = context.Process(
+            target=worker_loop,
+            args=(f"{socket.gethostname()}-{os.getpid()}-{i}",),
+            name=f"pipeline-worker-{i}"
+        )
+        worker.start()
+        workers.append(worker)
+    return workers
+
+
+def stop_workers(workers: list[multiprocessing.Process]) -> None:
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.join()
+
+
+def main():
+    load_dotenv()
+    settings = WorkerSettings()
+    engine = create_engine(f'{settings.database_uri}/github_assistant')
+    GithubRepoInfo.metadata.create_all(engine)
+    PipelineJob.metadata.create_all(engine)
+    GithubToken.metadata.create_all(engine)
+    GithubTokenUsage.metadata.create_all(engine)
+
+    workers = start_workers(settings.processes)
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        print("\nStopping pipeline workers...")
+        stop_workers(workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import contextlib
+import io
+import json
+
+import pytest
+
+dlt = pytest.importorskip("dlt")
+
+from data_pipelines.github import _checkpointed_resource, helpers  # noqa: E402
+from data_pipelines.github.rate_limit import get_budget  # noqa: E402
+
+ITEMS = [{"number": n} for n in range(250)]
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    """Serves `ITEMS` as GitHub would, in chunks of 25 nodes, and records the (page size, cursor) of every request"""
+    sent = []
+
+    def stream_page(access_token, query, variables, node_type, chunk_size):
+        size, after = variables["items_per_page"], variables.get("page_after")
+        assert size <= 100, f"Requesting {size} records on the connection exceeds the `first` limit of 100 records"
+        sent.append((size, after))
+        start = int(after) if after else 0
+        nodes = ITEMS[start:start + size]
+        yield "page_info", {"endCursor": str(start + len(nodes))}
+        for offset in range(0, len(nodes), 25):
+            yield "nodes", nodes[offset:offset + 25]
+        yield "rate_limit", {"cost": 1, "remaining": 4999}
+
+    monkeypatch.setattr(helpers, "STREAM_RESPONSES", True)
+    monkeypatch.setattr(helpers, "streaming_available", lambda: True)
+    monkeypatch.setattr(helpers, "_stream_graphql_page", stream_page)
+    return sent
+
+
+def _pages(checkpoint):
+    return helpers._get_graphql_pages("token", "query", {"items_per_page": 100}, "stargazers", None, checkpoint)
+
+
+def _load_and_resume(chunks: int):
+    """Stops after `chunks` chunks, like a checkpointed batch, and resumes from a copy of the checkpoint"""
+    checkpoint = {}
+    loaded = []
+    for number, chunk in enumerate(_pages(checkpoint), 1):
+        loaded.extend(chunk)
+        if number == chunks:
+            break
+    resumed = dict(checkpoint)
+    loaded.extend(item for chunk in _pages(resumed) for item in chunk)
+    return loaded, checkpoint
+
+
+def test_resume_mid_page(requests):
+    loaded, checkpoint = _load_and_resume(2)
+    assert checkpoint == {"page_after": None, "page_offset": 50, "page_size": 100, "items_count": 50}
+    assert loaded == ITEMS
+    assert requests[:2] == [(100, None), (100, None)]
+
+
+def test_resume_end_of_page(requests):
+    loaded, checkpoint = _load_and_resume(4)
+    assert checkpoint == {"page_after": "100", "page_offset": 0, "page_size": 100, "items_count": 100}
+    assert loaded == ITEMS
+    assert requests[:2] == [(100, None), (100, "100")]
+
+
+def test_resume_legacy_end_of_page_checkpoint(requests):
+    checkpoint = {"page_after": "100", "page_offset": 100, "page_size": 100, "items_count": 200}
+    loaded = [item for chunk in _pages(checkpoint) for item in chunk]
+    assert loaded == ITEMS[200:]
+    assert requests[0] == (100, "100")
+
+
+def test_stream_releases_slot_before_yielding_nodes(monkeypatch):
+    pytest.importorskip("ijson")
+    page = {
+        "data": {
+            "repository": {"stargazers": {"pageInfo": {"endCursor": "25"}, "edges": ITEMS[:25]}},
+            "rateLimit": {"cost": 1, "remaining": 4999},
+        }
+    }
+
+    class Client:
+        @contextlib.contextmanager
+        def stream(self, method, url, **kwargs):
+            yield io.BytesIO(json.dumps(page).encode())
+
+    monkeypatch.setattr(helpers, "get_http_client", lambda: Client())
+    budget = get_budget("slot-token")
+    nodes = []
+    for kind, value in helpers._stream_graphql_page("slot-token", "query", {}, "stargazers", 10):
+        if kind == "nodes":
+            # all slots of the token are free while the consumer works on the chunk
+            assert budget._slots._value == budget.max_concurrent
+            nodes.extend(value)
+    assert nodes == ITEMS[:25]
+
+
+def test_checkpointed_batches_count_pages(requests, monkeypatch):
+    state = {}
+    monkeypatch.setattr(dlt.current, "resource_state", lambda: state)
+    resource = _checkpointed_resource("stargazers", _pages, batch_pages=2)
+    loaded = list(resource)
+    assert loaded == ITEMS[:200]
+    assert state["checkpoint"]["page_after"] == "200"
+
+
+def test_partitioned_commits_checkpoint_completed_partitions(monkeypatch):
+    import pendulum
+
+    from data_pipelines.github import github_commits
+
+    windows = [(pendulum.datetime(2020 + year, 1, 1), pendulum.datetime(2021 + year, 1, 1)) for year in range(5)]
+    commits = {window[0].isoformat(): [{"oid": f"{window[0].year}-{n}"} for n in range(3)] for window in windows}
+
+    def graphql_pages(access_token, query, variables, node_type, max_items):
+        yield commits[variables["since"]]
+
+    monkeypatch.setattr(helpers, "_commit_partitions", lambda *args: windows)
+    monkeypatch.setattr(helpers, "_get_graphql_pages", graphql_pages)
+    state = {}
+    monkeypatch.setattr(dlt.current, "resource_state", lambda: state)
+
+    loaded = []
+    for _ in range(3):
+        source = github_commits("owner", "name", "token", partitioned=True, batch_pages=1)
+        loaded.extend(source.resources["commits"])
+        if "checkpoint" not in state:
+            break
+        assert len(state["checkpoint"]["done"]) == 4
+    assert "checkpoint" not in state
+    assert sorted(item["oid"] for item in loaded) == sorted(item["oid"] for items in commits.values() for item in items)
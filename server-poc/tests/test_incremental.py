@@ -0,0 +1,57 @@
+import pytest
+
+dlt = pytest.importorskip("dlt")
+
+from data_pipelines.github import github_commits, github_stargazers, helpers  # noqa: E402
+
+
+def _stars(*stars):
+    return [{"starredAt": starred_at, "node": {"login": login, "url": f"https://github.com/{login}"}} for login, starred_at in stars]
+
+
+def _commits(*commits):
+    return [{"oid": oid, "committedDate": committed_date} for oid, committed_date in commits]
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    return dlt.pipeline("incremental", pipelines_dir=str(tmp_path))
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    """Serves the canned pages instead of querying GitHub"""
+    served = []
+    monkeypatch.setattr(helpers, "_get_graphql_pages", lambda *args, **kwargs: iter(served))
+    return served
+
+
+def _extracted(pipeline, source, table):
+    load_id, metrics = next(iter(pipeline.extract(source).metrics.items()))
+    table_metrics = metrics[0]["table_metrics"]
+    return table_metrics[table].items_count if table in table_metrics else 0
+
+
+def test_incremental_stargazers(pipeline, pages):
+    pages.append(_stars(("b", "2024-01-03T00:00:00Z"), ("a", "2024-01-02T00:00:00Z")))
+    assert _extracted(pipeline, github_stargazers("owner", "name", "token", incremental=True), "stargazers") == 2
+
+    pages[:] = [_stars(("c", "2024-01-04T00:00:00Z"), ("b", "2024-01-03T00:00:00Z"), ("a", "2024-01-02T00:00:00Z"))]
+    # `b` has the last loaded `starredAt` and is deduplicated by its login
+    assert _extracted(pipeline, github_stargazers("owner", "name", "token", incremental=True), "stargazers") == 1
+
+
+def test_stargazer_rows_keep_their_columns():
+    assert helpers._stargazer_row(_stars(("a", "2024-01-02T00:00:00Z"))[0]) == {
+        "starredAt": "2024-01-02T00:00:00Z",
+        "user__login": "a",
+        "user": {"url": "https://github.com/a"},
+    }
+
+
+def test_incremental_commits(pipeline, pages):
+    pages.append(_commits(("2", "2024-01-03T00:00:00Z"), ("1", "2024-01-02T00:00:00Z")))
+    assert _extracted(pipeline, github_commits("owner", "name", "token", incremental=True), "commits") == 2
+
+    pages[:] = [_commits(("3", "2024-01-04T00:00:00Z"), ("2", "2024-01-03T00:00:00Z"))]
+    assert _extracted(pipeline, github_commits("owner", "name", "token", incremental=True), "commits") == 1
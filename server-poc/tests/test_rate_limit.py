@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+pytest.importorskip("dlt")
+
+from data_pipelines.github.rate_limit import GraphQLBudget, RateLimitScheduler, RateLimitStore, query_shape_key  # noqa: E402
+
+
+class MemoryStore(RateLimitStore):
+    def __init__(self):
+        self.counts = {}
+
+    def load(self, access_token):
+        return self.counts.get(access_token)
+
+    def save(self, access_token, limit, remaining, reset_at):
+        self.counts[access_token] = {"limit": limit, "remaining": remaining, "reset_at": reset_at}
+
+
+def test_scheduler_waits_for_credits_spent_by_other_processes():
+    store = MemoryStore()
+    reset_at = time.time() + 3600
+    store.save("token", 5000, 40, reset_at)
+    scheduler = RateLimitScheduler(reserved_credits=50, access_token="token", store=store)
+    assert scheduler.headroom(query_key=1) is None
+    scheduler._sync()
+    assert scheduler.remaining == 40
+    assert scheduler._wait_seconds(1) > 0
+
+
+def test_scheduler_shares_what_it_sees():
+    store = MemoryStore()
+    scheduler = RateLimitScheduler(reserved_credits=50, access_token="token", store=store)
+    scheduler.after(1, scheduler.before(1), {"limit": 5000, "cost": 1, "remaining": 4000, "resetAt": "2099-01-01T00:00:00Z"})
+    assert store.load("token")["remaining"] == 4000
+
+
+def test_budget_splits_the_per_minute_limit_between_processes():
+    assert GraphQLBudget(4, 900, "token", MemoryStore(), processes=4).max_per_minute == 225
+
+
+def test_aliased_batch_queries_share_a_cost_prediction():
+    from data_pipelines.github.queries import COMMENT_REACTIONS_QUERY
+
+    first = "{" + COMMENT_REACTIONS_QUERY % (0, "IC_kwDOA") + "}"
+    second = "{" + COMMENT_REACTIONS_QUERY % (0, "IC_kwDOB") + "}"
+    larger = "{" + ",".join(COMMENT_REACTIONS_QUERY % (i, f"IC_{i}") for i in range(2)) + "}"
+    assert query_shape_key(first) == query_shape_key(second)
+    assert query_shape_key(first) != query_shape_key(larger)
+
+    scheduler = RateLimitScheduler(reserved_credits=50)
+    scheduler.after(query_shape_key(first), 0, {"cost": 3, "remaining": 4000})
+    assert scheduler.predict_cost(query_shape_key(second)) == 3
@@ -0,0 +1,116 @@
+import io
+import json
+
+import pytest
+
+pytest.importorskip("dlt")
+
+from requests import Response  # noqa: E402
+from requests.adapters import HTTPAdapter  # noqa: E402
+from requests.exceptions import ReadTimeout  # noqa: E402
+
+from data_pipelines.github import helpers  # noqa: E402
+from data_pipelines.github.http_client import GitHubHttpClient  # noqa: E402
+from data_pipelines.github.rate_limit import GraphQLBudget  # noqa: E402
+from data_pipelines.github.retry import RetryBudgetExhausted, RetryPolicy  # noqa: E402
+from data_pipelines.github.token_pool import TokenPool  # noqa: E402
+
+PAGE = {
+    "data": {
+        "repository": {"stargazers": {"pageInfo": {"endCursor": "1"}, "edges": [{"starredAt": "2024-01-01T00:00:00Z"}]}},
+        "rateLimit": {"cost": 1, "remaining": 4999},
+    }
+}
+
+
+class StubTransport(HTTPAdapter):
+    """Answers with the canned `outcomes` in order, a status code, a GraphQL response or an exception,
+    and records the sent variables and tokens"""
+
+    def __init__(self, outcomes):
+        super().__init__()
+        self.outcomes = list(outcomes)
+        self.sent = []
+        self.tokens = []
+
+    def send(self, request, **kwargs):
+        self.sent.append(json.loads(request.body)["variables"])
+        self.tokens.append(request.headers["Authorization"].removeprefix("Bearer "))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        body = PAGE if outcome == 200 else {}
+        if isinstance(outcome, dict):
+            outcome, body = 200, outcome
+        response = Response()
+        response.status_code = outcome
+        response.request = request
+        response.url = request.url
+        response.raw = io.BytesIO(json.dumps(body).encode())
+        return response
+
+
+@pytest.fixture
+def github(monkeypatch):
+    """Sends GraphQL requests to a stub transport and returns it with the retry policy and budget they use"""
+    def install(*outcomes):
+        transport = StubTransport(outcomes)
+        client = GitHubHttpClient()
+        client.client._pooled_adapter = transport
+        policy = RetryPolicy(max_attempts=4, base_delay=0, budget_min=10)
+        budget = GraphQLBudget(max_concurrent=2, max_per_minute=100)
+        monkeypatch.setattr(helpers, "get_http_client", lambda: client)
+        monkeypatch.setattr(helpers, "get_retry_policy", lambda: policy)
+        monkeypatch.setattr(helpers, "get_budget", lambda token: budget)
+        return transport, policy, budget
+
+    return install
+
+
+def _stream(variables):
+    return list(helpers._stream_graphql_page("retry-token", "query", variables, "stargazers", 10))
+
+
+def _query(variables):
+    return helpers._run_graphql_query("retry-token", "query", variables)
+
+
+@pytest.mark.parametrize("fetch", [_query, _stream])
+def test_failed_attempts_are_retried_by_the_policy_only(github, fetch):
+    if fetch is _stream:
+        pytest.importorskip("ijson")
+    transport, policy, budget = github(502, ReadTimeout("read timed out"), 200)
+    fetch({"items_per_page": 100})
+
+    # one request per attempt reaches the transport, the page size halves with every timed out attempt
+    assert [variables["items_per_page"] for variables in transport.sent] == [100, 50, 25]
+    assert policy.stats.requests == 3
+    assert policy.stats.retries == 2
+    assert policy.stats.reasons == {"http_502": 1, "timeout": 1}
+    assert budget.requests == 3
+
+
+def test_gives_up_after_max_attempts(github):
+    transport, policy, budget = github(*[502] * 10)
+    with pytest.raises(RetryBudgetExhausted):
+        _query({"items_per_page": 100})
+    assert len(transport.sent) == policy.max_attempts
+    assert budget.requests == policy.max_attempts
+    assert policy.stats.retries == policy.max_attempts - 1
+
+
+@pytest.mark.parametrize("fetch", [_query, _stream])
+def test_pooled_token_without_repo_access_falls_back_to_the_run_token(github, monkeypatch, fetch):
+    if fetch is _stream:
+        pytest.importorskip("ijson")
+    not_found = {"data": {"repository": None}, "errors": [{"type": "NOT_FOUND", "message": "Could not resolve to a Repository"}]}
+    transport, policy, budget = github(not_found, 200)
+    pool = TokenPool(["pooled-token"])
+    # the pooled token looks like the one with the most credits left
+    monkeypatch.setattr(pool, "choose", lambda query_key, access_token=None: "pooled-token")
+    monkeypatch.setattr(helpers, "get_token_pool", lambda: pool)
+    fetch({"items_per_page": 100})
+
+    assert transport.tokens == ["pooled-token", "retry-token"]
+    assert pool.revoked == set()
+    assert policy.stats.retries == 0